@@ -0,0 +1,137 @@
+"""
+AIMD concurrency control per host for the download engine.
+
+Each host starts at a small number of parallel requests. While latency stays
+close to the best seen and errors are rare, the limit grows additively (about
+one slot per round of requests). A timeout, connection error, 429 or 503
+halves it, at most once per cooldown window. CDNs such as i.4cdn.org and
+i.redd.it climb to high parallelism on their own, while HTML sites stay low.
+"""
+import asyncio, time
+from collections import deque
+from contextlib import asynccontextmanager
+
+DEFAULT_INITIAL = 4
+DEFAULT_MIN = 1
+DEFAULT_MAX = 16
+LATENCY_TOLERANCE = 2.0
+ERROR_THRESHOLD = 0.1
+DECREASE_COOLDOWN = 2.0
+THROUGHPUT_WINDOW = 10.0
+
+HOST_MAX = {
+    "i.4cdn.org": 48,
+    "i.redd.it": 48,
+    "preview.redd.it": 24,
+    "cdn5-images.motherlessmedia.com": 24,
+    "fapello.com": 4,
+    "motherless.com": 4,
+    "www.erome.com": 4,
+}
+
+
+class HostState:
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.cond = asyncio.Condition()
+        self.latency = None
+        self.best_latency = None
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+        self.transfers = deque()
+
+    def throughput(self, now):
+        while self.transfers and now - self.transfers[0][0] > THROUGHPUT_WINDOW:
+            self.transfers.popleft()
+        return sum(n for _, n in self.transfers) / THROUGHPUT_WINDOW
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial=DEFAULT_INITIAL, minimum=DEFAULT_MIN, maximum=DEFAULT_MAX, host_max=None,
+                 ceiling=None):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.host_max = dict(HOST_MAX)
+        self.host_max.update(host_max or {})
+        # Upper bound for every host, whatever HOST_MAX says.
+        self.ceiling = ceiling
+        self._hosts = {}
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            maximum = self.host_max.get(host, self.maximum)
+            if self.ceiling:
+                maximum = max(self.minimum, min(maximum, self.ceiling))
+            state = self._hosts[host] = HostState(min(self.initial, maximum), self.minimum, maximum)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, host):
+        state = self._host(host)
+        async with state.cond:
+            await state.cond.wait_for(lambda: state.in_flight < int(state.limit))
+            state.in_flight += 1
+        try:
+            yield
+        finally:
+            async with state.cond:
+                state.in_flight -= 1
+                state.cond.notify_all()
+
+    def try_acquire(self, host, count):
+        """Take up to ``count`` free slots without waiting. Returns how many were taken."""
+        state = self._host(host)
+        taken = max(0, min(count, int(state.limit) - state.in_flight))
+        state.in_flight += taken
+        return taken
+
+    async def release(self, host, count):
+        state = self._host(host)
+        async with state.cond:
+            state.in_flight -= count
+            state.cond.notify_all()
+
+    def limit(self, host):
+        """Current number of parallel requests allowed for ``host``."""
+        return int(self._host(host).limit)
+
+    def record_success(self, host, latency):
+        """Report a response that arrived after ``latency`` seconds (time to headers)."""
+        state = self._host(host)
+        state.error_rate *= 0.9
+        state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+        state.best_latency = latency if state.best_latency is None else min(state.best_latency, latency)
+        healthy = (state.latency <= state.best_latency * LATENCY_TOLERANCE
+                   and state.error_rate < ERROR_THRESHOLD)
+        if healthy and state.limit < state.maximum:
+            state.limit = min(state.maximum, state.limit + 1 / state.limit)
+
+    def record_failure(self, host):
+        """Report a timeout, connection error, 429 or 503."""
+        state = self._host(host)
+        state.error_rate = state.error_rate * 0.9 + 0.1
+        now = time.monotonic()
+        if now - state.last_decrease >= DECREASE_COOLDOWN:
+            state.limit = max(state.minimum, state.limit / 2)
+            state.last_decrease = now
+
+    def record_bytes(self, host, count):
+        self._host(host).transfers.append((time.monotonic(), count))
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            host: {
+                "limit": int(s.limit),
+                "in_flight": s.in_flight,
+                "latency_ms": round((s.latency or 0) * 1000),
+                "error_rate": round(s.error_rate, 3),
+                "bytes_per_sec": round(s.throughput(now)),
+            }
+            for host, s in list(self._hosts.items())
+        }
@@ -0,0 +1,212 @@
+"""
+Pool of warm headless Chrome instances shared by the Selenium-based scrapers.
+
+Starting Chrome takes seconds, so browsers are kept alive between jobs and
+lent out one page at a time. A lent browser is health-checked first and
+replaced if it no longer answers. After MAX_PAGES page loads it is quit and
+a fresh one is started, which bounds the memory long-lived Chrome processes
+pile up. A background thread closes browsers left idle for IDLE_TIMEOUT, so
+no Chrome outlives the last job by much. At most ``size``
+browsers exist at once across every job, so that number also caps how many
+pages are loaded in parallel.
+
+By default browsers use a lightweight profile: images, media, fonts and
+stylesheets are never fetched, and ``get`` returns at DOMContentLoaded
+instead of waiting for every resource. Scrapers read media URLs from the DOM
+and wait explicitly for the elements they need.
+"""
+import atexit, threading, time
+from contextlib import contextmanager
+from http_client import HEADERS
+from settings import load_settings, get_setting
+
+DEFAULT_SIZE = 4
+MAX_PAGES = 200
+IDLE_TIMEOUT = 300
+# How often the reaper thread looks for idle browsers.
+REAP_INTERVAL = 30
+
+BLOCKED_URLS = [
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.mp4", "*.webm", "*.m4v", "*.mov", "*.mp3",
+]
+
+
+class PooledBrowser:
+    """A WebDriver plus the bookkeeping the pool needs. Unknown attributes go to the driver."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.last_used = time.monotonic()
+        self.broken = False
+
+    def get(self, url):
+        self.pages += 1
+        self.driver.get(url)
+
+    def healthy(self):
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+class BrowserPool:
+    def __init__(self, size=DEFAULT_SIZE, max_pages=MAX_PAGES, idle_timeout=IDLE_TIMEOUT, lightweight=True):
+        self.size = max(1, size)
+        self.lightweight = lightweight
+        self.max_pages = max_pages
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        # The reaper waits on its own event: sharing _cond could swallow a
+        # notify meant for a job waiting in acquire().
+        self._stopped = threading.Event()
+        self._reaper = None
+
+    def new_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument(f"--user-agent={HEADERS['User-Agent']}")
+        if not self.lightweight:
+            return webdriver.Chrome(options=chrome_options)
+
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        })
+        driver = webdriver.Chrome(options=chrome_options)
+        try:
+            # Catches what the content settings miss: <video> sources, CSS
+            # and fonts requested from scripts.
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+        except Exception as e:
+            print(f"Could not block media requests in browser: {e}")
+        return driver
+
+    def _take(self):
+        """Return an idle browser, or None after reserving room for a new one."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return None
+                self._cond.wait()
+
+    def _discard(self, browser):
+        if browser is not None:
+            browser.quit()
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        self._reap_idle()
+        while True:
+            browser = self._take()
+            if browser is None:
+                break
+            if browser.healthy():
+                return browser
+            self._discard(browser)
+        try:
+            return PooledBrowser(self.new_driver())
+        except Exception:
+            self._discard(None)
+            raise
+
+    def release(self, browser):
+        browser.last_used = time.monotonic()
+        if browser.broken or browser.pages >= self.max_pages or self._closed:
+            self._discard(browser)
+            return
+        with self._cond:
+            self._idle.append(browser)
+            self._cond.notify()
+            if self._reaper is None and self.idle_timeout:
+                self._reaper = threading.Thread(target=self._reap_loop, name="browser-reaper", daemon=True)
+                self._reaper.start()
+
+    @contextmanager
+    def browser(self):
+        """Borrow a browser for the duration of the ``with`` block."""
+        browser = self.acquire()
+        try:
+            yield browser
+        except Exception:
+            browser.broken = not browser.healthy()
+            raise
+        finally:
+            self.release(browser)
+
+    def _reap_loop(self):
+        while not self._stopped.wait(min(REAP_INTERVAL, self.idle_timeout)):
+            self._reap_idle()
+
+    def _reap_idle(self):
+        now = time.monotonic()
+        with self._cond:
+            stale = [b for b in self._idle if now - b.last_used > self.idle_timeout]
+            self._idle = [b for b in self._idle if b not in stale]
+        for browser in stale:
+            self._discard(browser)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "open": self._created, "idle": len(self._idle)}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        self._stopped.set()
+        for browser in idle:
+            self._discard(browser)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def load_pool_settings():
+    data = load_settings()
+    return {
+        "size": get_setting(data, "browser_pool_size", DEFAULT_SIZE, int),
+        "max_pages": get_setting(data, "browser_max_pages", MAX_PAGES, int),
+        "lightweight": get_setting(data, "browser_lightweight", True, bool),
+    }
+
+
+def get_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(**load_pool_settings())
+            atexit.register(_pool.close)
+        return _pool
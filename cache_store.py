@@ -0,0 +1,190 @@
+"""
+Persistent dedup store for already-downloaded URLs and file contents.
+
+Replaces the old cache/<site>.txt flat files with a single SQLite database in
+WAL mode. Membership checks are indexed lookups, so a job never has to load
+every seen URL into memory, and inserts are written in batches. The content
+table maps a SHA-256 digest to the first file saved with those bytes, and the
+state table holds small per-site key/value bookkeeping for incremental runs.
+"""
+import sqlite3, threading
+from pathlib import Path
+from metrics import get_metrics
+
+CACHE_DIR = Path("cache")
+DB_FILE = CACHE_DIR / "cache.db"
+BATCH_SIZE = 500
+
+
+class SeenStore:
+    def __init__(self, path=DB_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " site TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " PRIMARY KEY (site, url)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content ("
+            " digest TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self.migrate_text_caches(self.path.parent)
+
+    def contains(self, site, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM seen WHERE site = ? AND url = ?", (site, url)
+            ).fetchone()
+        get_metrics().inc("cache_lookups_total", site=site, result="hit" if row else "miss")
+        return row is not None
+
+    def filter_new(self, site, urls):
+        """Return the URLs in ``urls`` that are not in the store yet, keeping their order."""
+        urls = list(dict.fromkeys(urls))
+        seen = set()
+        with self._lock:
+            for i in range(0, len(urls), BATCH_SIZE):
+                batch = urls[i:i + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT url FROM seen WHERE site = ? AND url IN ({placeholders})",
+                    [site, *batch],
+                )
+                seen.update(row[0] for row in rows)
+        metrics = get_metrics()
+        metrics.inc("cache_lookups_total", len(seen), site=site, result="hit")
+        metrics.inc("cache_lookups_total", len(urls) - len(seen), site=site, result="miss")
+        return [u for u in urls if u not in seen]
+
+    def add_many(self, site, urls):
+        rows = [(site, u) for u in urls if u]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO seen (site, url) VALUES (?, ?)", rows)
+
+    def count(self, site):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen WHERE site = ?", (site,)).fetchone()[0]
+
+    def clear(self, site):
+        # Incremental-sync state lives in "<site>" / "<site>:..." namespaces and
+        # would otherwise make the next run skip what was just forgotten.
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM state WHERE namespace = ? OR namespace LIKE ?", (site, f"{site}:%")
+            )
+            return self._conn.execute("DELETE FROM seen WHERE site = ?", (site,)).rowcount
+
+    def clear_all(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM state")
+            return self._conn.execute("DELETE FROM seen").rowcount
+
+    def get_state(self, namespace, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else default
+
+    def get_state_map(self, namespace):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,))
+            return dict(rows.fetchall())
+
+    def get_state_many(self, namespace, keys):
+        """Return ``{key: value}`` for those of ``keys`` that exist in ``namespace``."""
+        keys = [str(k) for k in dict.fromkeys(keys)]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = keys[i:i + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM state WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace, *batch],
+                )
+                found.update(rows.fetchall())
+        return found
+
+    def set_state(self, namespace, key, value):
+        self.set_state_many(namespace, {key: value})
+
+    def set_state_many(self, namespace, values):
+        rows = [(namespace, str(k), None if v is None else str(v)) for k, v in values.items()]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)", rows
+            )
+
+    def delete_state(self, namespace, keys):
+        rows = [(namespace, str(k)) for k in keys]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", rows)
+
+    def claim_content(self, digest, path):
+        """
+        Record ``path`` as the canonical copy of ``digest`` unless another file
+        already holds that content. Returns the canonical path.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO content (digest, path) VALUES (?, ?)", (digest, path))
+            return self._conn.execute("SELECT path FROM content WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def replace_content(self, digest, path):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO content (digest, path) VALUES (?, ?)", (digest, path))
+
+    def migrate_text_caches(self, cache_dir):
+        # Old per-site caches were cache/<site>.txt with one URL per line.
+        # cache/<subreddit>_last.txt holds Reddit pagination state, not URLs.
+        for txt in Path(cache_dir).glob("*.txt"):
+            if txt.stem.endswith("_last"):
+                continue
+            site = txt.stem
+            with open(txt, "r", encoding="utf-8", errors="ignore") as f:
+                batch = []
+                for line in f:
+                    url = line.strip()
+                    if url:
+                        batch.append(url)
+                    if len(batch) >= BATCH_SIZE:
+                        self.add_many(site, batch)
+                        batch = []
+                self.add_many(site, batch)
+            txt.replace(txt.with_suffix(".txt.migrated"))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SeenStore()
+        return _store
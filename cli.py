@@ -0,0 +1,97 @@
+"""
+Headless batch runner for cron jobs and scripts.
+
+    python cli.py https://boards.4chan.org/wsg/thread/123456 r/pics --limit 50
+    python cli.py --jobs jobs.jsonl
+
+Each line of a jobs file is a JSON object with a "url" key and optional
+"limit", "sort", "media_type", "download_all", "watch" and "priority" keys. Jobs run
+through the same Download*Thread classes as the GUI, but without importing
+PyQt5, and only the sites that are actually used get their dependencies
+imported.
+"""
+import argparse, json, os, sys
+
+# Must be set before any scraper module is imported.
+os.environ["IMAGESCRAPER_HEADLESS"] = "1"
+
+from job_queue import JobScheduler, FAILED
+from metrics import get_metrics, metrics_port_setting
+from scrapers import create_download_thread
+
+
+def load_jobs(path):
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            job = json.loads(line)
+            if "url" not in job:
+                raise ValueError(f"{path}:{line_no}: job has no \"url\"")
+            jobs.append(job)
+    return jobs
+
+
+def build_thread(job, args):
+    return create_download_thread(
+        job["url"],
+        limit=job.get("limit", args.limit),
+        sort=job.get("sort", args.sort),
+        media_type=job.get("media_type", args.media_type),
+        download_all=job.get("download_all", args.download_all),
+        watch=job.get("watch", args.watch),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download media without the GUI.")
+    parser.add_argument("urls", nargs="*", help="thread, album, profile or subreddit URLs (r/name, u/name)")
+    parser.add_argument("--jobs", help="JSONL file with one job object per line")
+    parser.add_argument("--limit", type=int, default=10, help="Reddit image limit (default: 10)")
+    parser.add_argument("--sort", choices=["hot", "new", "top"], default="hot", help="Reddit sort order")
+    parser.add_argument("--media-type", choices=["images", "videos", "both"], default="both",
+                        help="Fapello media type")
+    parser.add_argument("--download-all", action="store_true", help="ignore --limit for Reddit users")
+    parser.add_argument("--watch", action="store_true", help="keep polling 4chan threads for new posts")
+    parser.add_argument("--workers", type=int, default=3, help="jobs to run at the same time (default: 3)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (default: metrics_port setting)")
+    args = parser.parse_args(argv)
+
+    jobs = [{"url": url} for url in args.urls]
+    if args.jobs:
+        jobs.extend(load_jobs(args.jobs))
+    if not jobs:
+        parser.error("give at least one URL or --jobs FILE")
+
+    metrics_port = args.metrics_port if args.metrics_port is not None else metrics_port_setting()
+    if metrics_port:
+        get_metrics().start_server(metrics_port)
+        print(f"📈 Metrics on http://127.0.0.1:{metrics_port}/metrics")
+
+    scheduler = JobScheduler(args.workers, on_log=lambda job, msg: print(f"[#{job.id}] {msg}"))
+    failures = 0
+    for job in jobs:
+        try:
+            thread = build_thread(job, args)
+        except ValueError as e:
+            print(f"❌ {job['url']}: {e}")
+            failures += 1
+            continue
+        queued = scheduler.submit(thread, job["url"], priority=job.get("priority", 0))
+        print(f"📋 Queued job #{queued.id}: {job['url']}")
+
+    try:
+        scheduler.wait_all()
+    except KeyboardInterrupt:
+        print("⏹️ Cancelling running jobs...")
+        scheduler.cancel_all()
+        scheduler.wait_all()
+    failures += sum(1 for job in scheduler.jobs() if job.state == FAILED)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
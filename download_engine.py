@@ -0,0 +1,564 @@
+"""
+Shared async download engine.
+
+Every Download*Thread hands its list of media URLs to one process-wide engine.
+The engine owns a single aiohttp session running on a background event loop,
+so connections are pooled per host and kept alive across files and jobs
+instead of paying a fresh TCP+TLS handshake for every download.
+"""
+import asyncio, atexit, hashlib, os, threading, time
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+from adaptive_concurrency import AdaptiveConcurrency
+from cache_store import get_store
+from rate_limit import get_rate_limiter, BACKOFF_STATUSES
+from metrics import get_metrics
+from settings import load_settings, get_setting
+import phash_index
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_PER_HOST = 4
+CHUNK_SIZE = 256 * 1024
+WRITER_THREADS = 4
+DUPLICATE_MODES = ("hardlink", "skip")
+# Files at least this large, from hosts that accept byte ranges, are fetched
+# as up to SEGMENTS parallel ranges (never more than the host's AIMD limit).
+SEGMENT_THRESHOLD = 32 * 1024 * 1024
+SEGMENTS = 4
+# State namespace mapping a .part path to the ETag or Last-Modified of the
+# response it was started from.
+PARTS_NAMESPACE = "download:parts"
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class RangesIgnored(Exception):
+    """The host advertised byte ranges but answered a Range request without one."""
+
+
+def _write_and_hash(f, digest, chunk):
+    f.write(chunk)
+    if digest is not None:
+        digest.update(chunk)
+
+
+def _validator(headers):
+    # If-Range needs a strong ETag; fall back to Last-Modified.
+    etag = headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified", "")
+
+
+def _preallocate(path, size):
+    with open(path, "wb") as f:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass
+        f.truncate(size)
+
+
+class DownloadEngine:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                 chunk_size=CHUNK_SIZE, retries=3, duplicate_mode="hardlink", perceptual_hash=True,
+                 offload_writes=True, segment_threshold=SEGMENT_THRESHOLD, segments=SEGMENTS):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.duplicate_mode = duplicate_mode if duplicate_mode in DUPLICATE_MODES else "hardlink"
+        self.perceptual_hash = perceptual_hash and phash_index.available()
+        self.segment_threshold = segment_threshold
+        self.segments = segments
+        # Hosts whose Accept-Ranges turned out to be a lie; fetched in one piece.
+        self._no_ranges = set()
+        # per_host is only the starting point; AIMD moves each host's limit.
+        # No host may fill every global permit, so one busy host can't
+        # starve downloads from the others.
+        self.hosts = AdaptiveConcurrency(initial=per_host, ceiling=max(1, concurrency - 1))
+        # Disk writes and hashing can run on a small writer pool so a slow
+        # disk never stalls the event loop. Each download awaits its own write
+        # before reading the next chunk, so memory stays at about
+        # chunk_size x in-flight downloads.
+        self._writer = ThreadPoolExecutor(WRITER_THREADS, thread_name_prefix="download-writer") if offload_writes else None
+        self._session = None
+        self._sem = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="download-engine", daemon=True)
+        self._thread.start()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout, read_bufsize=self.chunk_size
+            )
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _download_one(self, url, path, headers, log, should_stop=None, progress=None):
+        host = urlparse(url).hostname
+        started = time.monotonic()
+        metrics = get_metrics()
+        result = await self._download_attempts(url, path, headers, log, should_stop, progress)
+        metrics.inc("downloads_total", host=host, result=result)
+        metrics.event("download", url=url, host=host, result=result, path=str(path),
+                      bytes=path.stat().st_size if path.exists() else None,
+                      seconds=round(time.monotonic() - started, 3))
+        return result in ("ok", "duplicate")
+
+    async def _download_attempts(self, url, path, headers, log, should_stop, progress):
+        """Returns "ok", "duplicate", "failed" or "cancelled"."""
+        # Bytes go to <name>.part and are renamed into place only once the
+        # body is complete, so an interrupted download never leaves a
+        # truncated file at the final path and can resume with a Range request.
+        session = await self._get_session()
+        limiter = get_rate_limiter()
+        metrics = get_metrics()
+        host = urlparse(url).hostname
+        part = path.with_name(path.name + ".part")
+        for attempt in range(self.retries):
+            if should_stop and should_stop():
+                return "cancelled"
+            try:
+                # The host slot and rate-limit token (including any backoff
+                # pause) come first; the global permit is only held for the
+                # transfer itself, so a busy or paused host never sits on
+                # permits that other hosts and jobs could use.
+                async with self.hosts.slot(host):
+                    await limiter.acquire_async(host)
+                    async with self._sem:
+                        offset = part.stat().st_size if part.exists() else 0
+                        request_headers = dict(headers)
+                        if offset:
+                            request_headers["Range"] = f"bytes={offset}-"
+                            # A changed resource answers 200 with the whole
+                            # new body instead of appending to the old bytes.
+                            validator = get_store().get_state(PARTS_NAMESPACE, str(part))
+                            if validator:
+                                request_headers["If-Range"] = validator
+                        started = time.monotonic()
+                        async with session.get(url, headers=request_headers) as resp:
+                            latency = time.monotonic() - started
+                            metrics.observe("request_latency_seconds", latency, host=host)
+                            metrics.inc("requests_total", host=host, status=resp.status)
+                            if resp.status in BACKOFF_STATUSES:
+                                # Pauses the host for every job; the next acquire waits it out.
+                                delay = limiter.backoff(host, resp.headers.get("Retry-After"))
+                                self.hosts.record_failure(host)
+                                metrics.inc("retries_total", host=host, reason=str(resp.status))
+                                metrics.event("backoff", host=host, status=resp.status, delay=round(delay, 1))
+                                continue
+                            limiter.record_success(host)
+                            self.hosts.record_success(host, latency)
+                            if resp.status == 416 and offset:
+                                part.unlink()
+                                get_store().delete_state(PARTS_NAMESPACE, [str(part)])
+                                metrics.inc("retries_total", host=host, reason="416")
+                                continue
+                            elif resp.status not in (200, 206):
+                                log(f"Failed ({resp.status}): {url}")
+                                return "failed"
+
+                            segments = self._segment_count(resp, host) if resp.status == 200 else 1
+                            if segments > 1:
+                                digest = await self._download_segmented(
+                                    session, url, headers, part, resp, segments, host, should_stop, progress
+                                )
+                            else:
+                                digest = await self._stream_to_part(resp, part, offset, host, should_stop, progress)
+                os.replace(part, path)
+                get_store().delete_state(PARTS_NAMESPACE, [str(part)])
+                if not self._dedupe(path, digest.hexdigest(), log):
+                    return "duplicate"
+                if self.perceptual_hash:
+                    phash_index.get_phash_index().hash_async(path)
+                return "ok"
+            except DownloadCancelled:
+                return "cancelled"
+            except Exception as e:
+                self.hosts.record_failure(host)
+                metrics.inc("retries_total", host=host, reason="error")
+                log(f"Error downloading {url}: {e}")
+                await asyncio.sleep(2 ** attempt)
+        return "failed"
+
+    async def _stream_to_part(self, resp, part, offset, host, should_stop, progress=None):
+        if resp.status == 206:
+            # Re-reading a large .part must not stall the event loop.
+            digest = await self._loop.run_in_executor(self._writer, self._hash_prefix, part)
+            mode = "ab"
+        else:
+            digest = hashlib.sha256()
+            offset = 0
+            mode = "wb"
+            get_store().set_state(PARTS_NAMESPACE, str(part), _validator(resp.headers))
+        expected = resp.content_length
+        if progress:
+            progress.expect(None if expected is None else offset + expected, offset)
+        received = 0
+        with open(part, mode) as f:
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                await self._write_chunk(f, digest, chunk)
+                received += len(chunk)
+                self.hosts.record_bytes(host, len(chunk))
+                get_metrics().inc("download_bytes_total", len(chunk), host=host)
+                if progress:
+                    progress.add(len(chunk))
+                if should_stop and should_stop():
+                    # Leave the .part behind so a later run can resume it.
+                    raise DownloadCancelled()
+        if expected is not None and received < expected:
+            raise IOError(f"connection closed after {offset + received} bytes")
+        return digest
+
+    def _segment_count(self, resp, host):
+        size = resp.content_length
+        if (not self.segment_threshold or self.segments < 2 or size is None or size < self.segment_threshold
+                or resp.headers.get("Accept-Ranges", "").lower() != "bytes" or host in self._no_ranges):
+            return 1
+        return max(1, min(self.segments, self.hosts.limit(host)))
+
+    async def _download_segmented(self, session, url, headers, part, first, segments, host, should_stop,
+                                  progress=None):
+        # The file is preallocated and each range is written at its own
+        # offset through its own handle. The first range is read from the
+        # response that is already open; each of the others is a new Range
+        # request holding a host slot of its own, so segments count against
+        # the host's AIMD limit. Only slots that are free right now are used:
+        # waiting for more while holding one could deadlock the host. A
+        # half-written segmented file has holes, so it can't be resumed like
+        # a plain .part and is removed if anything fails. A host that answers
+        # a Range request with the whole body gets one plain request instead.
+        extra = self.hosts.try_acquire(host, segments - 1)
+        if not extra:
+            return await self._stream_to_part(first, part, 0, host, should_stop, progress)
+        ranges_ignored = False
+        try:
+            size = first.content_length
+            step = -(-size // (extra + 1))
+            ranges = [(start, min(size, start + step) - 1) for start in range(0, size, step)]
+            _preallocate(part, size)
+            if progress:
+                progress.expect(size)
+            tasks = [
+                asyncio.ensure_future(self._fetch_segment(session, url, headers, part, start, end, host,
+                                                          should_stop, first if start == 0 else None, progress))
+                for start, end in ranges
+            ]
+            try:
+                written = sum(await asyncio.gather(*tasks))
+                if written != size:
+                    raise IOError(f"segments wrote {written} bytes, expected {size}")
+            except BaseException as e:
+                # gather() leaves the other segments running when one fails.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                part.unlink(missing_ok=True)
+                if not isinstance(e, RangesIgnored):
+                    raise
+                self._no_ranges.add(host)
+                get_metrics().event("ranges_ignored", host=host, url=url)
+                ranges_ignored = True
+        finally:
+            await self.hosts.release(host, extra)
+        if ranges_ignored:
+            return await self._fetch_whole(session, url, headers, part, host, should_stop, progress)
+        # Reading the file back both verifies it and gives the content hash.
+        return await self._loop.run_in_executor(self._writer, self._hash_prefix, part)
+
+    async def _fetch_whole(self, session, url, headers, part, host, should_stop, progress=None):
+        await get_rate_limiter().acquire_async(host)
+        async with session.get(url, headers=headers) as resp:
+            get_metrics().inc("requests_total", host=host, status=resp.status)
+            if resp.status != 200:
+                raise IOError(f"answered with {resp.status}")
+            return await self._stream_to_part(resp, part, 0, host, should_stop, progress)
+
+    async def _fetch_segment(self, session, url, headers, part, start, end, host, should_stop, resp=None,
+                             progress=None):
+        limiter = get_rate_limiter()
+        metrics = get_metrics()
+        position = start
+        with open(part, "r+b") as f:
+            f.seek(start)
+            for attempt in range(self.retries):
+                try:
+                    if resp is None:
+                        await limiter.acquire_async(host)
+                        request_headers = dict(headers, Range=f"bytes={position}-{end}")
+                        started = time.monotonic()
+                        resp = await session.get(url, headers=request_headers)
+                        latency = time.monotonic() - started
+                        metrics.observe("request_latency_seconds", latency, host=host)
+                        metrics.inc("requests_total", host=host, status=resp.status)
+                        if resp.status in BACKOFF_STATUSES:
+                            delay = limiter.backoff(host, resp.headers.get("Retry-After"))
+                            metrics.inc("retries_total", host=host, reason=str(resp.status))
+                            metrics.event("backoff", host=host, status=resp.status, delay=round(delay, 1))
+                            raise IOError(f"range {position}-{end} answered with {resp.status}")
+                        content_range = resp.headers.get("Content-Range", "")
+                        if resp.status == 200 or (resp.status == 206
+                                                  and not content_range.startswith(f"bytes {position}-")):
+                            # Not worth retrying: the host ignores ranges.
+                            raise RangesIgnored(f"range {position}-{end} answered with {resp.status} {content_range}")
+                        if resp.status != 206:
+                            raise IOError(f"range {position}-{end} answered with {resp.status}")
+                        limiter.record_success(host)
+                        self.hosts.record_success(host, latency)
+                    async for chunk in resp.content.iter_chunked(self.chunk_size):
+                        chunk = chunk[:end + 1 - position]
+                        await self._write_chunk(f, None, chunk)
+                        position += len(chunk)
+                        self.hosts.record_bytes(host, len(chunk))
+                        metrics.inc("download_bytes_total", len(chunk), host=host)
+                        if progress:
+                            progress.add(len(chunk))
+                        if should_stop and should_stop():
+                            raise DownloadCancelled()
+                        if position > end:
+                            return position - start
+                    raise IOError(f"range {start}-{end} ended at {position}")
+                except (DownloadCancelled, RangesIgnored):
+                    raise
+                except Exception:
+                    if attempt == self.retries - 1:
+                        raise
+                    self.hosts.record_failure(host)
+                    await asyncio.sleep(2 ** attempt)
+                finally:
+                    if resp is not None:
+                        resp.release()
+                        resp = None
+
+    async def _write_chunk(self, f, digest, chunk):
+        if self._writer is None:
+            _write_and_hash(f, digest, chunk)
+        else:
+            await self._loop.run_in_executor(self._writer, _write_and_hash, f, digest, chunk)
+
+    def _hash_prefix(self, part):
+        digest = hashlib.sha256()
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(block)
+        return digest
+
+    def _dedupe(self, path, digest, log):
+        # The same bytes often arrive under different URLs (crossposts,
+        # reposts, mirrors). Keep one copy and hardlink or drop the rest.
+        store = get_store()
+        canonical = store.claim_content(digest, str(path))
+        if canonical == str(path):
+            return True
+        if not os.path.exists(canonical):
+            store.replace_content(digest, str(path))
+            return True
+        os.remove(path)
+        if self.duplicate_mode == "hardlink":
+            try:
+                os.link(canonical, path)
+            except OSError:
+                pass
+        log(f"♻️ Duplicate of {canonical}: {path.name}")
+        return False
+
+    def open_batch(self, headers=None, on_result=None, on_progress=None, log=print,
+                   should_stop=None, max_pending=None, progress=None):
+        """
+        Start a streaming batch: items can be added while earlier ones are
+        already downloading. With ``max_pending`` set, ``add`` blocks once
+        that many items are queued or in flight. ``progress`` is a
+        progress.ProgressAggregator fed with every file and byte.
+        """
+        return DownloadBatch(self, headers, on_result, on_progress, log, should_stop, max_pending, progress)
+
+    def download(self, items, headers=None, on_result=None, on_progress=None, log=print, should_stop=None,
+                 progress=None):
+        """
+        Download ``items`` -- ``(url, path)`` or ``(url, path, extra_headers)``
+        tuples -- and block until all of them are finished. ``should_stop`` is
+        polled between files and chunks to cancel the remaining work.
+        Returns the list of URLs that were downloaded successfully.
+        """
+        batch = self.open_batch(headers, on_result, on_progress, log, should_stop, progress=progress)
+        batch.add_many(items)
+        return batch.close()
+
+    async def _fetch(self, url, headers, as_json):
+        session = await self._get_session()
+        limiter = get_rate_limiter()
+        host = urlparse(url).hostname
+        metrics = get_metrics()
+        for attempt in range(self.retries):
+            await limiter.acquire_async(host)
+            started = time.monotonic()
+            async with session.get(url, headers=headers) as resp:
+                metrics.observe("request_latency_seconds", time.monotonic() - started, host=host)
+                metrics.inc("requests_total", host=host, status=resp.status)
+                if resp.status in BACKOFF_STATUSES:
+                    limiter.backoff(host, resp.headers.get("Retry-After"))
+                    if attempt < self.retries - 1:
+                        metrics.inc("retries_total", host=host, reason=str(resp.status))
+                        continue
+                    return resp.status, None, None
+                limiter.record_success(host)
+                if resp.status != 200:
+                    return resp.status, None, None
+                body = await resp.json(content_type=None) if as_json else await resp.text()
+                return resp.status, body, resp.headers.get("Last-Modified")
+
+    def host_stats(self):
+        """Per-host concurrency limit, in-flight requests, latency, error rate and throughput."""
+        return self._submit(self._host_stats()).result()
+
+    async def _host_stats(self):
+        return self.hosts.snapshot()
+
+    def fetch_json(self, url, headers=None):
+        """Fetch ``url`` over the pooled session. Returns ``(status, data)``."""
+        status, data, _ = self._submit(self._fetch(url, headers, True)).result()
+        return status, data
+
+    def fetch_json_if_modified(self, url, last_modified=None, headers=None):
+        """
+        Conditional GET with If-Modified-Since. Returns ``(status, data,
+        last_modified)``; status 304 means nothing changed and data is None.
+        """
+        headers = dict(headers or {})
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        status, data, modified = self._submit(self._fetch(url, headers, True)).result()
+        return status, data, modified or last_modified
+
+    def close(self):
+        if self._session is not None and not self._session.closed:
+            try:
+                self._submit(self._session.close()).result(timeout=5)
+            except Exception:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
+
+class DownloadBatch:
+    def __init__(self, engine, headers, on_result, on_progress, log, should_stop, max_pending, progress=None):
+        self.engine = engine
+        self.progress = progress
+        self.headers = dict(headers or {})
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.log = log
+        self.should_stop = should_stop
+        self.total = 0
+        self.completed = 0
+        self._done = []
+        self._seen = set()
+        self._settled = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._slots = threading.Semaphore(max_pending) if max_pending else None
+
+    def add(self, url, path, extra_headers=None):
+        """Queue one download. Returns False if ``url`` is already part of this batch."""
+        with self._lock:
+            if url in self._seen:
+                return False
+            self._seen.add(url)
+            self.total += 1
+        if self.progress:
+            self.progress.add_files()
+        get_metrics().add_gauge("downloads_pending", 1)
+        if self._slots is not None:
+            self._slots.acquire()
+        request_headers = dict(self.headers)
+        if extra_headers:
+            request_headers.update(extra_headers)
+        future = self.engine._submit(self.engine._download_one(
+            url, Path(path), request_headers, self.log, self.should_stop,
+            self.progress.file() if self.progress else None,
+        ))
+        future.add_done_callback(lambda f, url=url: self._finished(url, f))
+        return True
+
+    def add_many(self, items):
+        for item in items:
+            self.add(*item)
+
+    def _finished(self, url, future):
+        try:
+            get_metrics().add_gauge("downloads_pending", -1)
+            ok = not future.cancelled() and future.exception() is None and future.result()
+            if not future.cancelled() and future.exception() is not None:
+                self.log(f"Error downloading {url}: {future.exception()}")
+            with self._lock:
+                self.completed += 1
+                if ok:
+                    self._done.append(url)
+                completed, total = self.completed, self.total
+            if self._slots is not None:
+                self._slots.release()
+            if self.progress:
+                self.progress.file_finished(ok)
+            if self.on_result:
+                self.on_result(url, ok)
+            if self.on_progress:
+                self.on_progress(completed, total)
+        finally:
+            with self._lock:
+                self._settled += 1
+                self._idle.notify_all()
+
+    def close(self):
+        """Wait for everything queued so far. Returns the URLs that succeeded."""
+        with self._lock:
+            while self._settled < self.total:
+                self._idle.wait()
+            done = list(self._done)
+        if self.progress:
+            self.progress.finish()
+        return done
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def load_engine_settings():
+    data = load_settings()
+    return {
+        "concurrency": get_setting(data, "download_concurrency", DEFAULT_CONCURRENCY, int),
+        "per_host": get_setting(data, "per_host_connections", DEFAULT_PER_HOST, int),
+        "duplicate_mode": get_setting(data, "duplicate_mode", "hardlink"),
+        "perceptual_hash": get_setting(data, "perceptual_hash", True, bool),
+        "chunk_size": get_setting(data, "download_chunk_kb", CHUNK_SIZE // 1024, int) * 1024,
+        "offload_writes": get_setting(data, "offload_file_writes", True, bool),
+        "segment_threshold": get_setting(data, "segment_threshold_mb", SEGMENT_THRESHOLD // 2 ** 20, int) * 2 ** 20,
+        "segments": get_setting(data, "download_segments", SEGMENTS, int),
+    }
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DownloadEngine(**load_engine_settings())
+            atexit.register(_engine.close)
+        return _engine
@@ -0,0 +1,88 @@
+"""
+Shared blocking HTTP client for page fetches, API calls and HEAD probes.
+
+One pooled requests.Session is reused by every job. Each request first waits
+on the process-wide rate limiter for its host, and 429/503 answers trigger
+the host-wide backoff and are retried.
+"""
+import threading, time, requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from rate_limit import get_rate_limiter, BACKOFF_STATUSES
+from metrics import get_metrics
+
+DEFAULT_TIMEOUT = 30
+RETRIES = 3
+# Below this many calls left in an API's X-Ratelimit window (Reddit sends
+# these), the host is paused until the window resets.
+RATELIMIT_RESERVE = 2
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/122.0.0.0 Safari/537.36"
+    ),
+    "Referer": "https://boards.4chan.org/",
+}
+
+
+class LimitedSession(requests.Session):
+    def __init__(self, pool_size=32):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        host = urlparse(url).hostname
+        limiter = get_rate_limiter()
+        metrics = get_metrics()
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        for attempt in range(RETRIES):
+            limiter.acquire(host)
+            started = time.monotonic()
+            response = super().request(method, url, *args, **kwargs)
+            metrics.observe("request_latency_seconds", time.monotonic() - started, host=host)
+            metrics.inc("requests_total", host=host, status=response.status_code)
+            if response.status_code not in BACKOFF_STATUSES:
+                limiter.record_success(host)
+                self.respect_quota(host, response)
+                return response
+            delay = limiter.backoff(host, response.headers.get("Retry-After"))
+            metrics.event("backoff", host=host, status=response.status_code, delay=round(delay, 1))
+            if attempt < RETRIES - 1:
+                metrics.inc("retries_total", host=host, reason=str(response.status_code))
+                response.close()
+        return response
+
+    def respect_quota(self, host, response):
+        # Every job shares one pause, so concurrent subreddit syncs spend the
+        # API window together instead of each running it dry.
+        try:
+            remaining = float(response.headers["X-Ratelimit-Remaining"])
+            reset = float(response.headers["X-Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        if remaining < RATELIMIT_RESERVE:
+            get_rate_limiter().pause(host, reset)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = LimitedSession()
+        return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_session().head(url, **kwargs)
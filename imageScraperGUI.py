@@ -1,7 +1,4 @@
-import sys, os, time, json, re, asyncio, requests, shutil, aiohttp, praw
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+import sys, json, re, shutil, time
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QTextEdit,
@@ -12,639 +9,55 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QIcon
 from pathlib import Path
-from tqdm.asyncio import tqdm
-from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor
-from dotenv import load_dotenv
-
-load_dotenv()
-
-reddit = praw.Reddit(
-    client_id=os.getenv("REDDIT_CLIENT_ID"),
-    client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-    user_agent=os.getenv("REDDIT_USER_AGENT"),
-    username=os.getenv("REDDIT_USERNAME"),
-    password=os.getenv("REDDIT_PASSWORD")
-)
-
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/122.0.0.0 Safari/537.36"
-    ),
-    "Referer": "https://boards.4chan.org/",
-}
+from cache_store import get_store
+from download_engine import get_engine
+from rate_limit import get_rate_limiter
+from job_queue import JobScheduler
+from metrics import get_metrics, metrics_port_setting
+from scrapers import create_download_thread, create_reddit_sync_thread
+import phash_index
+import settings
 
-SUPPORTED_EXTS = ['.jpg', '.png', '.gif', '.webm']
 
-class DownloadEromeThread(QThread):
-    base_folder = Path("ISdownloads/erome")
+class NearDuplicateScanThread(QThread):
     progress_updated = pyqtSignal(int)
     log_message = pyqtSignal(str)
-    cache_file = Path("cache/erome.txt")
+    report_file = Path("cache/near_duplicates.json")
 
-    def __init__(self, url):
+    def __init__(self, root="ISdownloads", threshold=phash_index.DEFAULT_THRESHOLD):
         super().__init__()
-        self.url = url
-        self.cache_file.parent.mkdir(exist_ok=True)
-
-    def sanitize_filename(self, url):
-        path = urlparse(url).path
-        return Path(path).name
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    def download_file(self, url, folder, referer=None):
-        filename = self.sanitize_filename(url)
-        path = folder / filename
-        headers = HEADERS.copy()
-        if referer:
-            headers["Referer"] = referer
-
-        try:
-            with requests.get(url, stream=True, headers=headers, timeout=30) as response:
-                response.raise_for_status()
-                total = int(response.headers.get("content-length", 0))
-                with open(path, "wb") as f:
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=1024 * 1024):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total:
-                                self.progress_updated.emit(int(downloaded * 100 / total))
-            return True
-        except Exception as e:
-            self.log_to_file(f"❌ Failed to download {url}: {e}")
-            return False
+        self.root = root
+        self.threshold = threshold
 
     def run(self):
         try:
-            self.scrape_erome_gallery(self.url)
+            self.find_near_duplicates()
         except Exception as e:
             self.log_message.emit(f"❌ Error: {e}")
 
-    def scrape_erome_gallery(self, url):
-        self.log_message.emit(f"Scraping gallery: {url}")
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            self.log_message.emit(f"❌ Failed to access gallery ({response.status_code})")
+    def find_near_duplicates(self):
+        if not phash_index.available():
+            self.log_message.emit("⚠️ Near-duplicate scan needs numpy and Pillow installed.")
             return
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        gallery_id = url.rstrip("/").split("/")[-1]
-        folder = self.base_folder / gallery_id
-        folder.mkdir(parents=True, exist_ok=True)
-
-        media_urls = set()
-        for div in soup.select('div.img[data-src]'):
-            src = div.get('data-src')
-            if src and src.startswith("https"):
-                media_urls.add(src)
-        for source in soup.select('video > source[src]'):
-            src = source.get('src')
-            if src and src.startswith("https"):
-                media_urls.add(src)
-
-        cached = self.load_cache()
-        media_urls = [u for u in media_urls if u not in cached]
-        self.log_message.emit(f"Found {len(media_urls)} new media files.")
-
-        downloaded_urls = []
-        for i, url in enumerate(media_urls):
-            if self.download_file(url, folder, referer=self.url):
-                downloaded_urls.append(url)
-            self.progress_updated.emit(int((i + 1) * 100 / len(media_urls)))
-
-        self.update_cache(downloaded_urls)
-        self.log_message.emit(f"✅ Finished downloading to: {folder.resolve()}")
-
-class Download4chanThread(QThread):
-    base_folder = Path("ISdownloads/4chan")
-    progress_updated = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    cache_file = Path("cache/4chan.txt")
-
-    def __init__(self, url):
-        super().__init__()
-        self.url = url
-        self.cache_file.parent.mkdir(exist_ok=True)
-
-    def run(self):
-        asyncio.run(self.download_4chan_thread(self.url))
-
-    def parse_4chan_thread_url(self, url):
-        match = re.search(r'boards\.4chan(?:nel)?\.org/(\w+)/thread/(\d+)', url)
-        if not match:
-            raise ValueError("Invalid 4chan thread URL")
-        return match.group(1), match.group(2)
-
-    async def fetch_4chan_thread_data(self, session, board, thread_id):
-        api_url = f"https://a.4cdn.org/{board}/thread/{thread_id}.json"
-        async with session.get(api_url) as resp:
-            if resp.status != 200:
-                raise Exception(f"Failed to fetch thread data ({resp.status})")
-            return await resp.json()
-
-    def get_4chan_media_url(self, board, tim, ext):
-        return f"https://i.4cdn.org/{board}/{tim}{ext}"
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    async def download_file(self, session, url, save_path, sem):
-        async with sem:
-            for attempt in range(3):
-                try:
-                    async with session.get(url) as resp:
-                        if resp.status == 429:
-                            retry_after = int(resp.headers.get("Retry-After", 2 ** attempt))
-                            await asyncio.sleep(retry_after)
-                            continue
-                        elif resp.status != 200:
-                            self.log_message.emit(f"Failed ({resp.status}): {url}")
-                            return False
-                        data = await resp.read()
-                        with open(save_path, "wb") as f:
-                            f.write(data)
-                        return True
-                except Exception as e:
-                    self.log_message.emit(f"Error downloading {url}: {e}")
-                    await asyncio.sleep(2 ** attempt)
-            return False
-
-    async def download_4chan_thread(self, url, max_concurrent=5):
-        board, thread_id = self.parse_4chan_thread_url(url)
-        folder = self.base_folder / board / thread_id
-        folder.mkdir(parents=True, exist_ok=True)
-
-        connector = aiohttp.TCPConnector(limit=10)
-        timeout = aiohttp.ClientTimeout(total=None)
-        sem = asyncio.Semaphore(max_concurrent)
-
-        cached_urls = self.load_cache()
-        new_urls = []
-        downloads = []
-
-        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
-            thread_data = await self.fetch_4chan_thread_data(session, board, thread_id)
-            posts = thread_data.get("posts", [])
-
-            for post in posts:
-                if "tim" in post and "ext" in post:
-                    ext = post["ext"].lower()
-                    if ext in SUPPORTED_EXTS:
-                        media_url = self.get_4chan_media_url(board, post["tim"], ext)
-                        if media_url in cached_urls:
-                            continue
-                        save_path = folder / f"{post['tim']}{ext}"
-                        downloads.append((media_url, save_path))
-                        new_urls.append(media_url)
-
-            total = len(downloads)
-            if total == 0:
-                self.log_message.emit("No new media to download.")
-                return
-
-            self.log_message.emit(f"Found {total} new files. Downloading...")
-            completed = 0
-
-            tasks = [self.download_file(session, url, save_path, sem) for url, save_path in downloads]
-
-            for f in tqdm(asyncio.as_completed(tasks), total=total):
-                await f
-                completed += 1
-                self.progress_updated.emit(int((completed / total) * 100))
-
-            self.update_cache(new_urls)
-            self.log_message.emit(f"✅ Download complete: {folder}")
-
-class DownloadFapelloThread(QThread):
-    base_folder = Path("ISdownloads/fapello")
-    progress_updated = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    cache_file = Path("cache/fapello.txt")
-
-    def __init__(self, url, media_type):
-        super().__init__()
-        self.url = url
-        self.media_type = media_type
-        self.cache_file.parent.mkdir(exist_ok=True)
-
-    def sanitize_filename(self, url):
-        return os.path.basename(urlparse(url).path.split("?")[0])
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    def run(self):
-        try:
-            self.scrape_fapello_profile(self.url, self.media_type)
-        except Exception as e:
-            self.log_message.emit(f"❌ Error: {e}")
-
-    def scrape_fapello_profile(self, profile_url, media_type):
-        username = profile_url.rstrip("/").split("/")[-1]
-        folder = self.base_folder / username
-        folder.mkdir(parents=True, exist_ok=True)
-
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument(f"--user-agent={HEADERS['User-Agent']}")
-        driver = webdriver.Chrome(options=chrome_options)
-
-        self.log_message.emit(f"🔍 Opening profile: {profile_url}")
-        driver.get(profile_url)
-        time.sleep(2)
-
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        scroll_attempts = 0
-
-        while scroll_attempts < 30:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-            scroll_attempts += 1
-
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        post_links = []
-
-        for a in soup.select(f"a[href^='https://fapello.com/{username}/']"):
-            parent = a.find_parent("div")
-            has_play_icon = parent and parent.select_one("img[src*='icon-play.svg']")
-
-            if media_type == "videos" and not has_play_icon:
-                continue
-            if media_type == "images" and has_play_icon:
-                continue
-
-            post_links.append(a.get("href"))
-
-        media_urls = set()
-        for post_url in set(post_links):
-            try:
-                self.log_message.emit(f"🔗 Opening post: {post_url}")
-                driver.get(post_url)
-                time.sleep(2)
-                post_soup = BeautifulSoup(driver.page_source, "html.parser")
-
-                if media_type in ("both", "images"):
-                    for img in post_soup.select("img[src*='/content/']"):
-                        src = img.get("src")
-                        if src and username in src and '_300px' not in src:
-                            media_urls.add(src)
-
-                if media_type in ("both", "videos"):
-                    for source in post_soup.select("video > source[src*='/content/']"):
-                        src = source.get("src")
-                        if src and username in src:
-                            media_urls.add(src)
-            except Exception as e:
-                self.log_message.emit(f"❌ Failed to scrape post {post_url}: {e}")
-
-        driver.quit()
-
-        cached = self.load_cache()
-        media_urls = [u for u in media_urls if u not in cached]
-        self.log_message.emit(f"⬇️ Starting downloads for {len(media_urls)} new files...")
-
-        downloaded_urls = []
-        for i, url in enumerate(media_urls):
-            try:
-                r = requests.get(url, stream=True, timeout=30)
-                r.raise_for_status()
-                filename = self.sanitize_filename(url)
-                path = folder / filename
-                with open(path, "wb") as f:
-                    for chunk in r.iter_content(1024 * 512):
-                        f.write(chunk)
-                downloaded_urls.append(url)
-                self.progress_updated.emit(int((i + 1) * 100 / len(media_urls)))
-            except Exception as e:
-                self.log_to_file(f"❌ Failed to download {url}: {e}")
-
-        self.update_cache(downloaded_urls)
-        self.log_message.emit(f"✅ Finished downloading from profile: {username}")
-
-class DownloadMotherlessThread(QThread):
-    base_folder = Path("ISdownloads/motherless")
-    progress_updated = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    cache_file = Path("cache/motherless.txt")
-
-    def __init__(self, url):
-        super().__init__()
-        self.url = url
-        self.cache_file.parent.mkdir(exist_ok=True)
-
-    def sanitize_filename(self, url):
-        path = urlparse(url).path
-        return os.path.basename(path)
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    def download_file(self, url, folder):
-        if not url:
-            self.log_message.emit("⚠️ Skipping empty URL.")
-            return False
-        filename = self.sanitize_filename(url)
-        path = folder / filename
-
-        r = requests.get(url, headers=HEADERS, stream=True)
-        total = int(r.headers.get("content-length", 0))
-        with open(path, 'wb') as f:
-            downloaded = 0
-            for chunk in r.iter_content(1024):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total:
-                        self.progress_updated.emit(int(downloaded * 100 / total))
-        return True
-
-    def run(self):
-        try:
-            self.download_motherless(self.url)
-        except Exception as e:
-            self.log_message.emit(f"❌ Error: {e}")
-
-    def download_motherless(self, url):
-        folder = self.base_folder / urlparse(url).path.split("/")[-1]
-        folder.mkdir(parents=True, exist_ok=True)
-        cached = self.load_cache()
-        new_urls = []
-
-        soup = BeautifulSoup(requests.get(url, headers=HEADERS).text, 'html.parser')
-
-        if soup.select_one('#motherless-media-image'):
-            src = soup.select_one('#motherless-media-image').get('src')
-            if src and src not in cached:
-                self.log_message.emit(f"🖼️ Downloading image: {src}")
-                if self.download_file(src, folder):
-                    new_urls.append(src)
-        elif soup.select_one('video source'):
-            src = soup.select_one('video source').get('src')
-            if src and src not in cached:
-                self.log_message.emit(f"🎞️ Downloading video: {src}")
-                if self.download_file(src, folder):
-                    new_urls.append(src)
-        elif soup.select('div[data-codename]'):
-            items = soup.select('div[data-codename]')
-            valid_items = [item for item in items if item.get("data-codename")]
-            self.log_message.emit(f"📁 Found {len(valid_items)} gallery items")
-            for i, div in enumerate(valid_items):
-                codename = div.get("data-codename")
-                mediatype = div.get("data-mediatype", "image")
-                if mediatype == "video":
-                    video_page_url = f"https://motherless.com/{codename}"
-                    page = requests.get(video_page_url, headers=HEADERS)
-                    page_soup = BeautifulSoup(page.text, 'html.parser')
-                    source = page_soup.select_one("video source")
-                    if source and source.get("src"):
-                        file_url = source.get("src")
-                        if file_url in cached:
-                            continue
-                        self.log_message.emit(f"⬇️ Downloading: {file_url}")
-                        if self.download_file(file_url, folder):
-                            new_urls.append(file_url)
-                else:
-                    gif_url = f"https://cdn5-images.motherlessmedia.com/images/{codename}.gif"
-                    jpg_url = f"https://cdn5-images.motherlessmedia.com/images/{codename}.jpg"
-                    file_url = gif_url if requests.head(gif_url, headers=HEADERS).status_code == 200 else jpg_url
-                    if file_url in cached:
-                        continue
-                    self.log_message.emit(f"⬇️ Downloading: {file_url}")
-                    if self.download_file(file_url, folder):
-                        new_urls.append(file_url)
-                self.progress_updated.emit(int((i + 1) * 100 / len(valid_items)))
-        else:
-            self.log_message.emit("❌ Content type not recognized.")
-
-        self.update_cache(new_urls)
-        self.log_message.emit("✅ Finished downloading Motherless content")
+        index = phash_index.get_phash_index()
+        self.log_message.emit(f"🔍 Hashing images under {self.root}...")
+        hashed = index.scan(
+            self.root,
+            progress=lambda done, total: self.progress_updated.emit(int(done * 100 / total)),
+        )
+        self.log_message.emit(f"🧮 Hashed {hashed} new image(s), {len(index)} indexed.")
 
-class DownloadRedditThread(QThread):
-    base_folder = Path("ISdownloads/reddit")
-    progress_updated = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    cache_file = Path("cache/reddit.txt")
-
-    def __init__(self, subreddit, limit, sort="hot"):
-        super().__init__()
-        self.subreddit = subreddit
-        self.limit = limit
-        self.cache_file.parent.mkdir(exist_ok=True)
-        self.sort = sort
+        groups = index.find_near_duplicates(self.threshold)
+        self.report_file.parent.mkdir(exist_ok=True)
+        with open(self.report_file, "w", encoding="utf-8") as f:
+            json.dump(groups, f, indent=2)
 
-    def sanitize_filename(self, url):
-        return os.path.basename(urlparse(url).path.split("?")[0])
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    def log_to_file(self, message):
-        with open("error_log.txt", "a", encoding="utf-8") as f:
-            f.write(message + "\n")
-
-    def run(self):
-        try:
-            self.download_images_from_subreddit(self.subreddit, self.limit)
-        except Exception as e:
-            self.log_message.emit(f"❌ Error: {e}")
-
-    def download_images_from_subreddit(self, subreddit_name, limit):
-        subreddit = reddit.subreddit(subreddit_name)
-        folder = self.base_folder / subreddit_name
-        folder.mkdir(parents=True, exist_ok=True)
-
-        cached = self.load_cache()
-        count = 0
-        new_urls = []
-
-        posts = {
-            "hot": subreddit.hot,
-            "new": subreddit.new,
-            "top": subreddit.top
-        }.get(self.sort, subreddit.hot)
-
-        # ✅ Load last post ID for pagination
-        after_file = Path(f"cache/{subreddit_name}_last.txt")
-        after_id = after_file.read_text().strip() if after_file.exists() else None
-        after_found = after_id is None  # Start immediately if no 'after_id'
-        post_limit = None  # Pull all, but break manually when count hits limit
-        last_post_id = None
-
-        for post in posts(limit=post_limit):
-            # ⛔ Skip until we find after_id (if defined)
-            if not after_found:
-                if post.fullname == after_id:
-                    after_found = True
-                else:
-                    continue
-
-            url = post.url
-            if url in cached:
-                continue
-
-            if any(url.lower().endswith(ext) for ext in SUPPORTED_EXTS):
-                try:
-                    response = requests.get(url, stream=True)
-                    response.raise_for_status()
-                    filename = self.sanitize_filename(url)
-                    path = folder / filename
-                    with open(path, 'wb') as f:
-                        for chunk in response.iter_content(1024):
-                            f.write(chunk)
-                    self.log_message.emit(f"🖼️ Downloaded: {filename}")
-                    new_urls.append(url)
-                    count += 1
-                    self.progress_updated.emit(int(count * 100 / limit))
-                    last_post_id = post.fullname
-                    if count >= limit:
-                        break
-                except Exception as e:
-                    self.log_to_file(f"❌ Failed to download {url}: {e}")
-                    continue
-
-        # ✅ If after_id never matched, warn about it
-        if after_id and not after_found:
-            self.log_message.emit(f"⚠️ Skipped: last ID '{after_id}' not found in post list.")
-
-        # ✅ Save last seen post ID for next pagination step
-        if last_post_id:
-            after_file.parent.mkdir(exist_ok=True)
-            after_file.write_text(last_post_id)
-
-        self.update_cache(new_urls)
         self.progress_updated.emit(100)
-        self.log_message.emit(f"✅ Downloaded {count} new image(s) from r/{subreddit_name}")
-
-
-
-class DownloadRedditUserThread(QThread):
-    base_folder = Path("ISdownloads/reddit_users")
-    progress_updated = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    cache_file = Path("cache/reddit_users.txt")
-
-    def __init__(self, username, limit, sort="hot"):
-        super().__init__()
-        self.username = username
-        self.limit = limit
-        self.cache_file.parent.mkdir(exist_ok=True)
-        self.sort = sort
-
-    def sanitize_filename(self, url):
-        return os.path.basename(urlparse(url).path.split("?")[0])
-
-    def load_cache(self):
-        if self.cache_file.exists():
-            with open(self.cache_file, "r") as f:
-                return set(line.strip() for line in f)
-        return set()
-
-    def update_cache(self, urls):
-        with open(self.cache_file, "a") as f:
-            for url in urls:
-                f.write(url + "\n")
-
-    def log_to_file(self, message):
-        with open("error_log.txt", "a", encoding="utf-8") as f:
-            f.write(message + "\n")
-
-    def run(self):
-        try:
-            self.download_user_images(self.username, self.limit)
-        except Exception as e:
-            self.log_message.emit(f"❌ Error: {e}")
-
-    def download_user_images(self, username, limit):
-        user = reddit.redditor(username)
-        folder = self.base_folder / username
-        folder.mkdir(parents=True, exist_ok=True)
-
-        cached = self.load_cache()
-        count = 0
-        new_urls = []
-
-        posts = {
-            "hot": user.submissions.hot,
-            "new": user.submissions.new,
-            "top": user.submissions.top
-        }.get(self.sort, user.submissions.hot)
-
-        for post in posts(limit=None):
-            url = post.url
-            if (("i.redd.it" in url or url.endswith(tuple(SUPPORTED_EXTS))) and url not in cached):
-                try:
-                    response = requests.get(url, stream=True)
-                    response.raise_for_status()
-                    filename = self.sanitize_filename(url)
-                    path = folder / filename
-                    with open(path, 'wb') as f:
-                        for chunk in response.iter_content(1024):
-                            f.write(chunk)
-                    self.log_message.emit(f"📥 {filename}")
-                    new_urls.append(url)
-                    count += 1
-                    if limit:
-                        self.progress_updated.emit(int(count * 100 / limit))
-
-                    if limit and count >= limit:
-                        break
-                except Exception as e:
-                    self.log_to_file(f"❌ Failed to download {url}: {e}")
-
-        self.progress_updated.emit(100)
-        self.update_cache(new_urls)
-        self.log_message.emit(f"✅ Downloaded {count} image(s) from u/{username}")
+        self.log_message.emit(
+            f"✅ Found {len(groups)} near-duplicate group(s) "
+            f"({sum(len(g) for g in groups)} files). Report: {self.report_file}"
+        )
 
 
 class SubredditBrowserWindow(QDialog):
@@ -683,6 +96,11 @@ class SubredditBrowserWindow(QDialog):
         self.button_box.rejected.connect(self.close)
         layout.addWidget(self.button_box)
 
+        self.sync_button = QPushButton("Sync All")
+        self.sync_button.setToolTip("Download what's new in every saved subreddit")
+        self.sync_button.clicked.connect(self.sync_all)
+        layout.addWidget(self.sync_button)
+
         self.list_widget.itemClicked.connect(self.download_subreddit)
         self.setLayout(layout)
 
@@ -713,11 +131,30 @@ class SubredditBrowserWindow(QDialog):
         limit = self.limit_spinbox.value()
         self.status.setText(f"⬇️ Downloading {limit} from r/{subreddit}...")
 
-        self.download_thread = DownloadRedditThread(subreddit, limit)
-        self.download_thread.log_message.connect(lambda msg: self.status.setText(msg))
-        self.download_thread.progress_updated.connect(lambda _: None)
-        self.download_thread.start()
+        download_thread = create_download_thread(f"r/{subreddit}", limit)
+        download_thread.log_message.connect(lambda msg: self.status.setText(msg))
+        self.parent().scheduler.submit(download_thread, f"r/{subreddit}")
 
+    def sync_all(self):
+        subreddits = [self.list_widget.item(i).data(Qt.UserRole) for i in range(self.list_widget.count())]
+        if not subreddits:
+            self.status.setText("ℹ️ No saved subreddits to sync.")
+            return
+        in_flight = int(self.parent().load_setting("reddit_sync_concurrency", 4))
+        sync_thread = create_reddit_sync_thread(subreddits, self.limit_spinbox.value(), "new", in_flight)
+        sync_thread.log_message.connect(lambda msg: self.status.setText(msg))
+        sync_thread.finished.connect(self.refresh_sync_times)
+        self.parent().scheduler.submit(sync_thread, f"Sync {len(subreddits)} subreddits")
+        self.status.setText(f"🔄 Queued sync of {len(subreddits)} subreddits")
+
+    def refresh_sync_times(self):
+        store = get_store()
+        for i in range(self.list_widget.count()):
+            item = self.list_widget.item(i)
+            last_sync = int(store.get_state(f"reddit:{item.data(Qt.UserRole)}", "last_sync", 0))
+            if last_sync:
+                synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_sync))
+                item.setToolTip(f"Last synced {synced}")
 
     def save_subreddit_list(self):
         subreddits = [self.list_widget.item(i).data(Qt.UserRole) for i in range(self.list_widget.count())]
@@ -732,6 +169,7 @@ class SubredditBrowserWindow(QDialog):
                     item = QListWidgetItem(f"r/{name}")
                     item.setData(Qt.UserRole, name)
                     self.list_widget.addItem(item)
+            self.refresh_sync_times()
             self.status.setText(f"📦 Loaded {len(subreddits)} subreddits.")
         except:
             self.status.setText("ℹ️ No saved subreddit list yet.")
@@ -826,6 +264,14 @@ class UniversalDownloaderGUI(QWidget):
         browse_nsfw.triggered.connect(self.open_subreddit_browser)
         tools_menu.addAction(browse_nsfw)
 
+        host_stats = QAction("Show Host Stats", self)
+        host_stats.triggered.connect(self.show_host_stats)
+        tools_menu.addAction(host_stats)
+
+        find_duplicates = QAction("Find Near-Duplicates", self)
+        find_duplicates.triggered.connect(self.find_near_duplicates)
+        tools_menu.addAction(find_duplicates)
+
 
         ### End of Menu Bar ###
 
@@ -855,6 +301,10 @@ class UniversalDownloaderGUI(QWidget):
 
         self.download_all_checkbox = QCheckBox("Download All Images")
         self.options_layout.addWidget(self.download_all_checkbox)
+
+        self.watch_checkbox = QCheckBox("Watch thread for new posts")
+        self.watch_checkbox.hide()
+        self.options_layout.addWidget(self.watch_checkbox)
      
         self.options_layout.addWidget(self.media_type_dropdown)
         self.options_layout.addWidget(self.limit_input)
@@ -865,6 +315,32 @@ class UniversalDownloaderGUI(QWidget):
         self.download_btn.clicked.connect(self.handle_download)
         layout.addWidget(self.download_btn)
 
+        # Job queue controls
+        queue_layout = QHBoxLayout()
+        self.priority_spinbox = QSpinBox()
+        self.priority_spinbox.setRange(0, 10)
+        queue_layout.addWidget(QLabel("Priority:"))
+        queue_layout.addWidget(self.priority_spinbox)
+
+        self.max_jobs_spinbox = QSpinBox()
+        self.max_jobs_spinbox.setRange(1, 16)
+        self.max_jobs_spinbox.setValue(int(self.load_setting("max_concurrent_jobs", 3)))
+        self.max_jobs_spinbox.valueChanged.connect(self.set_max_jobs)
+        queue_layout.addWidget(QLabel("Parallel jobs:"))
+        queue_layout.addWidget(self.max_jobs_spinbox)
+
+        self.cancel_job_btn = QPushButton("Cancel Selected")
+        self.cancel_job_btn.clicked.connect(self.cancel_selected_jobs)
+        queue_layout.addWidget(self.cancel_job_btn)
+        layout.addLayout(queue_layout)
+
+        self.scheduler = JobScheduler(
+            self.max_jobs_spinbox.value(),
+            on_change=self.refresh_job,
+            on_log=lambda job, msg: self.log_output.append(f"[#{job.id}] {msg}"),
+        )
+        self.job_items = {}
+
         # Progress bar
         self.progress_bar = QProgressBar()
         self.progress_bar.setTextVisible(True)
@@ -872,6 +348,12 @@ class UniversalDownloaderGUI(QWidget):
         self.progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #3399ff; }")
         layout.addWidget(self.progress_bar)
 
+        # Job list
+        self.job_list = QListWidget()
+        self.job_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.job_list.setMaximumHeight(120)
+        layout.addWidget(self.job_list)
+
         # Log Output
         self.log_output = QTextEdit()
         self.log_output.setReadOnly(True)
@@ -879,6 +361,14 @@ class UniversalDownloaderGUI(QWidget):
 
         self.setLayout(layout)
 
+        metrics_port = metrics_port_setting()
+        if metrics_port:
+            try:
+                get_metrics().start_server(metrics_port)
+                self.log_output.append(f"📈 Metrics on http://127.0.0.1:{metrics_port}/metrics")
+            except OSError as e:
+                self.log_output.append(f"⚠️ Could not start metrics endpoint: {e}")
+
 
     def apply_dark_theme(self):
         self.setStyleSheet("""
@@ -931,21 +421,19 @@ class UniversalDownloaderGUI(QWidget):
         """)
 
     def save_theme(self):
+        self.save_setting("theme", self.current_theme)
+
+    def save_setting(self, key, value):
         try:
-            with open("settings.json", "w") as f:
-                json.dump({"theme": self.current_theme}, f)
+            settings.save_setting(key, value)
         except Exception as e:
-            self.log_output.append(f"⚠️ Failed to save theme: {e}")
+            self.log_output.append(f"⚠️ Failed to save {key}: {e}")
+
+    def load_setting(self, key, default=None):
+        return settings.get_setting(settings.load_settings(), key, default)
 
     def load_theme(self):
-        try:
-            if os.path.exists("settings.json"):
-                with open("settings.json", "r") as f:
-                    data = json.load(f)
-                    return data.get("theme", "dark")
-        except Exception as e:
-            print(f"Failed to load theme: {e}")
-        return "dark"
+        return self.load_setting("theme", "dark")
 
     def toggle_theme_from_menu(self):
         if self.current_theme == "dark":
@@ -958,29 +446,21 @@ class UniversalDownloaderGUI(QWidget):
             self.toggle_theme_action.setText("Switch to Light Mode"); self.save_theme() if self.current_theme == "dark" else self.toggle_theme_action.setText("Switch to Dark Mode")
     ### File management ###
     def clear_cache_file(self, name):
-        path = Path("cache") / f"{name}.txt"
-        if path.exists():
-            try:
-                path.unlink()
-                self.log_output.append(f"🗑️ Cleared cache: {path}")
-            except Exception as e:
-                self.log_output.append(f"❌ Failed to delete {path}: {e}")
-        else:
-            self.log_output.append(f"⚠️ Cache not found: {path}")
+        try:
+            count = get_store().clear(name)
+            self.log_output.append(f"🗑️ Cleared {name} cache ({count} URL(s)).")
+        except Exception as e:
+            self.log_output.append(f"❌ Failed to clear {name} cache: {e}")
 
     def clear_all_caches(self):
-        cache_dir = Path("cache")
-        if cache_dir.exists():
-            try:
-                count = 0
-                for f in cache_dir.glob("*.txt"):
-                    f.unlink()
-                    count += 1
-                self.log_output.append(f"✅ Cleared {count} cache file(s).")
-            except Exception as e:
-                self.log_output.append(f"❌ Error clearing caches: {e}")
-        else:
-            self.log_output.append("⚠️ Cache folder does not exist.")
+        try:
+            count = get_store().clear_all()
+            cache_dir = Path("cache")
+            for f in cache_dir.glob("*.txt"):
+                f.unlink()
+            self.log_output.append(f"✅ Cleared all caches ({count} URL(s)).")
+        except Exception as e:
+            self.log_output.append(f"❌ Error clearing caches: {e}")
 
     def delete_download_folder(self, name):
         path = Path("ISdownloads") / name
@@ -1019,8 +499,7 @@ class UniversalDownloaderGUI(QWidget):
             self.log_output.append(f"⚠️ Failed to log URL: {e}")
 
     def log_to_file(self, message):
-        with open("error_log.txt", "a", encoding="utf-8") as f:
-            f.write(message + "\n")
+        get_metrics().error(message)
 
     def show_used_urls(self):
         log_file = Path("used_urls.txt")
@@ -1038,11 +517,37 @@ class UniversalDownloaderGUI(QWidget):
         self.subreddit_browser.show()
 
 
+    def show_host_stats(self):
+        concurrency = get_engine().host_stats()
+        rates = get_rate_limiter().snapshot()
+        if not concurrency and not rates:
+            self.log_output.append("ℹ️ No hosts contacted yet.")
+            return
+        lines = ["📊 Host stats:"]
+        for host in sorted(set(concurrency) | set(rates)):
+            c = concurrency.get(host, {})
+            r = rates.get(host, {})
+            lines.append(
+                f"  {host}: {c.get('in_flight', 0)}/{c.get('limit', '-')} in flight, "
+                f"{c.get('latency_ms', '-')} ms, {c.get('bytes_per_sec', 0) / 1024:.0f} KB/s, "
+                f"errors {c.get('error_rate', 0):.0%}, rate {r.get('rate', '-')}/s"
+                + (f", paused {r['paused_for']}s" if r.get("paused_for") else "")
+            )
+        self.log_output.append("\n".join(lines))
+
+    def find_near_duplicates(self):
+        self.scan_thread = NearDuplicateScanThread()
+        self.scan_thread.progress_updated.connect(self.update_progress)
+        self.scan_thread.log_message.connect(self.log_output.append)
+        self.scan_thread.start()
+
+
     def update_controls_based_on_input(self):
         text = self.url_input.text().strip()
 
         self.media_type_dropdown.hide()
         self.limit_input.hide()
+        self.watch_checkbox.hide()
 
         if (
             (isinstance(text, str) and (re.match(r"^(https?://)?(www\.)?reddit\.com|^r/", text)))
@@ -1053,7 +558,9 @@ class UniversalDownloaderGUI(QWidget):
             self.sort_dropdown.show()
         elif "fapello.com" in text:
             self.media_type_dropdown.show()
-        elif "erome.com" in text or "motherless.com" in text or "4chan.org" in text:
+        elif "4chan.org" in text:
+            self.watch_checkbox.show()
+        elif "erome.com" in text or "motherless.com" in text:
             pass  # No extra options
 
     def handle_download(self):
@@ -1063,75 +570,50 @@ class UniversalDownloaderGUI(QWidget):
 
         sort_method = self.sort_dropdown.currentText().lower() if self.sort_dropdown.isVisible() else "hot"
 
-        base_folder = Path("ISdownloads")
-        base_folder.mkdir(exist_ok=True)
-
-        if "4chan.org" in url:
-            Download4chanThread.base_folder = base_folder / "4chan"
-            self.download_thread = Download4chanThread(url)
-        elif "erome.com" in url:
-            DownloadEromeThread.base_folder = base_folder / "erome"
-            self.download_thread = DownloadEromeThread(url)
-        elif "fapello.com" in url:
-            media_type = self.media_type_dropdown.currentText()
-            DownloadFapelloThread.base_folder = base_folder / "fapello"
-            self.download_thread = DownloadFapelloThread(url, media_type)
-        elif "motherless.com" in url:
-            DownloadMotherlessThread.base_folder = base_folder / "motherless"
-            self.download_thread = DownloadMotherlessThread(url)
-        elif "reddit.com/user/" in url:
-            match = re.search(r"reddit\.com/user/([^/]+)/?", url)
-            if match:
-                username = match.group(1)
-            else:
-                self.log_output.append("❌ Could not extract Reddit username.")
-                return
-            if self.download_all_checkbox.isChecked():
-                limit = None  # no limit
-            else:
-                try:
-                    limit = int(self.limit_input.text().strip())
-                except ValueError:
-                    limit = 10
-
-            sort_method = self.sort_dropdown.currentText().lower()  # 'hot', 'new', or 'top'
-
-            DownloadRedditThread.base_folder = base_folder / "reddit_users"
-            self.download_thread = DownloadRedditUserThread(username, limit,sort_method)
-
-        elif re.match(r"^(https?://)?(www\.)?reddit\.com|^r/", url):
-            subreddit = url.split("/")[-1] if "/" in url else url.replace("r/", "").strip()
-            try:
-                limit = int(self.limit_input.text().strip())
-            except ValueError:
-                limit = 10  # Default
-            DownloadRedditThread.base_folder = base_folder / "reddit"
-            self.download_thread = DownloadRedditThread(subreddit, limit, sort_method)
-
-        elif re.match(r"^u\/[A-Za-z0-9_-]+\/?$", url):
-            username = url.replace("u/", "").replace("/", "").strip()
-            try:
-                limit = int(self.limit_input.text().strip())
-            except ValueError:
-                limit = 10
-            sort_method = self.sort_dropdown.currentText().lower() if self.sort_dropdown.isVisible() else "hot"
-            DownloadRedditThread.base_folder = base_folder / "reddit_users"
-            self.download_thread = DownloadRedditUserThread(username, limit, sort_method)
+        try:
+            limit = int(self.limit_input.text().strip())
+        except ValueError:
+            limit = 10  # Default
 
-        else:
-            self.log_output.append("❌ Unsupported URL or feature not implemented yet.")
+        try:
+            download_thread = create_download_thread(
+                url,
+                limit=limit,
+                sort=sort_method,
+                media_type=self.media_type_dropdown.currentText(),
+                download_all=self.download_all_checkbox.isChecked(),
+                watch=self.watch_checkbox.isVisible() and self.watch_checkbox.isChecked(),
+            )
+        except ValueError as e:
+            self.log_output.append(f"❌ {e}")
             return
 
-        
-
-        self.download_thread.progress_updated.connect(self.update_progress)
-        self.download_thread.log_message.connect(self.log_output.append)
-        self.download_thread.start()
+        job = self.scheduler.submit(download_thread, url, priority=self.priority_spinbox.value())
+        self.log_output.append(f"📋 Queued job #{job.id} ({self.scheduler.pending_count()} waiting)")
 
     def update_progress(self, value):
         self.progress_bar.setValue(value)
         self.progress_bar.setFormat(f"Progress: {value}%")
 
+    ### Job queue ###
+    def refresh_job(self, job):
+        item = self.job_items.get(job.id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job.id)
+            self.job_list.addItem(item)
+            self.job_items[job.id] = item
+        item.setText(str(job))
+        self.update_progress(self.scheduler.overall_progress())
+
+    def cancel_selected_jobs(self):
+        for item in self.job_list.selectedItems():
+            self.scheduler.cancel(item.data(Qt.UserRole))
+
+    def set_max_jobs(self, value):
+        self.scheduler.set_max_workers(value)
+        self.save_setting("max_concurrent_jobs", value)
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
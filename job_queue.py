@@ -0,0 +1,178 @@
+"""
+Job scheduler for running several downloads at once.
+
+Jobs wait in a priority queue and are started as worker slots free up, so any
+number of threads, albums and subreddits can be queued while at most
+``max_workers`` of them run concurrently. Works with Qt QThreads as well as the
+headless stand-in from scrapers.base.
+
+A thread with ``holds_slot = False`` (4chan thread watches, which mostly
+wait on a shared poller) starts right away and doesn't count against
+``max_workers``.
+"""
+import heapq, itertools, threading
+from progress import format_rate, format_eta
+from metrics import get_metrics
+
+PENDING = "pending"
+RUNNING = "running"
+CANCELLING = "cancelling"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    def __init__(self, job_id, label, thread, priority):
+        self.id = job_id
+        self.label = label
+        self.thread = thread
+        self.priority = priority
+        self.state = PENDING
+        self.progress = 0
+        self.stats = None
+        self.reported_state = None
+
+    def __str__(self):
+        text = f"#{self.id} [{self.state}] {self.progress}% {self.label}"
+        if self.stats and self.state == RUNNING:
+            s = self.stats
+            text += (f" — {s['files_done']}/{s['files_total']} files,"
+                     f" {format_rate(s['bytes_per_sec'])}, ETA {format_eta(s['eta'])}")
+        return text
+
+
+class JobScheduler:
+    def __init__(self, max_workers=3, on_change=None, on_log=None):
+        self.max_workers = max(1, max_workers)
+        self.on_change = on_change
+        self.on_log = on_log
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._heap = []
+        self._jobs = {}
+        self._running = set()
+        self._background = set()
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, thread, label, priority=0):
+        """Queue ``thread``; higher ``priority`` jobs start first. Returns the Job."""
+        background = not getattr(thread, "holds_slot", True)
+        with self._lock:
+            job = Job(next(self._ids), label, thread, priority)
+            self._jobs[job.id] = job
+            if background:
+                job.state = RUNNING
+                self._background.add(job.id)
+            else:
+                heapq.heappush(self._heap, (-priority, next(self._seq), job))
+        thread.progress_updated.connect(lambda value, job=job: self._on_progress(job, value))
+        if hasattr(thread, "progress_stats"):
+            thread.progress_stats.connect(lambda stats, job=job: self._on_stats(job, stats))
+        if self.on_log:
+            thread.log_message.connect(lambda message, job=job: self.on_log(job, message))
+        thread.finished.connect(lambda job=job: self._on_finished(job))
+        if background:
+            thread.start()
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.state == PENDING:
+                job.state = CANCELLED
+            elif job.state == RUNNING:
+                job.state = CANCELLING
+                job.thread.requestInterruption()
+            else:
+                return
+        self._notify(job)
+        with self._lock:
+            self._idle.notify_all()
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+        self._dispatch()
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.id)
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == PENDING)
+
+    def running_count(self):
+        with self._lock:
+            return len(self._running) + len(self._background)
+
+    def overall_progress(self):
+        with self._lock:
+            active = [job for job in self._jobs.values() if job.state in (PENDING, RUNNING, CANCELLING)]
+            if not active:
+                return 100
+            return int(sum(job.progress for job in active) / len(active))
+
+    def wait_all(self):
+        """Block until every queued job has finished or been cancelled."""
+        with self._lock:
+            while any(job.state in (PENDING, RUNNING, CANCELLING) for job in self._jobs.values()):
+                self._idle.wait()
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while len(self._running) < self.max_workers and self._heap:
+                _, _, job = heapq.heappop(self._heap)
+                if job.state != PENDING:
+                    continue
+                job.state = RUNNING
+                self._running.add(job.id)
+                started.append(job)
+        for job in started:
+            job.thread.start()
+            self._notify(job)
+
+    def _on_progress(self, job, value):
+        job.progress = value
+        self._notify(job)
+
+    def _on_stats(self, job, stats):
+        # Arrives together with progress_updated, which already notifies.
+        job.stats = stats
+
+    def _on_finished(self, job):
+        with self._lock:
+            self._running.discard(job.id)
+            self._background.discard(job.id)
+            if job.state == CANCELLING:
+                job.state = CANCELLED
+            elif getattr(job.thread, "error", None):
+                job.state = FAILED
+            else:
+                job.state = DONE
+                job.progress = 100
+            self._idle.notify_all()
+        self._notify(job)
+        self._dispatch()
+
+    def _notify(self, job):
+        if job.state != job.reported_state:
+            metrics = get_metrics()
+            with self._lock:
+                job.reported_state = job.state
+                for state in (PENDING, RUNNING, CANCELLING, DONE, FAILED, CANCELLED):
+                    metrics.set_gauge("jobs", sum(1 for j in self._jobs.values() if j.state == state), state=state)
+            metrics.event("job", id=job.id, label=job.label, state=job.state, stats=job.stats)
+        if self.on_change:
+            self.on_change(job)
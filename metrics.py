@@ -0,0 +1,203 @@
+"""
+Process-wide metrics and structured event log.
+
+Counters, gauges and latency histograms are kept in memory and served in
+the Prometheus text format on a local HTTP endpoint (``/metrics``) when
+``metrics_port`` is set in settings.json or passed to the CLI. Notable
+events -- finished downloads, job state changes, backoffs, errors -- are
+also appended as one JSON object per line to ``event_log`` (events.jsonl by
+default), so a long run can be analysed afterwards without scraping logs.
+"""
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from settings import load_settings, get_setting
+
+ERROR_LOG = "error_log.txt"
+DEFAULT_EVENT_LOG = "events.jsonl"
+PREFIX = "imagescraper_"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "downloads_total": "Finished downloads by host and result (ok, duplicate, failed, cancelled).",
+    "download_bytes_total": "Bytes received for media downloads.",
+    "requests_total": "HTTP requests by host and status.",
+    "retries_total": "Retried requests by host and reason.",
+    "request_latency_seconds": "Time from sending a request to receiving its headers.",
+    "cache_lookups_total": "Seen-URL cache lookups by site and result (hit, miss).",
+    "downloads_pending": "Downloads queued or in flight in the engine.",
+    "jobs": "Jobs in the scheduler by state.",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    def __init__(self, event_log=DEFAULT_EVENT_LOG):
+        self.event_log = event_log
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._log_file = None
+        self._server = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def add_gauge(self, name, delta, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def event(self, kind, **fields):
+        """Append one JSON line to the event log."""
+        if not self.event_log:
+            return
+        record = {"ts": round(time.time(), 3), "event": kind}
+        record.update(fields)
+        line = json.dumps(record, default=str) + "\n"
+        with self._log_lock:
+            try:
+                if self._log_file is None:
+                    self._log_file = open(self.event_log, "a", encoding="utf-8", buffering=1)
+                self._log_file.write(line)
+            except OSError as e:
+                print(f"Failed to write event log: {e}")
+
+    def error(self, message, **fields):
+        """Record an error in error_log.txt and as an "error" event."""
+        with self._log_lock:
+            with open(ERROR_LOG, "a", encoding="utf-8") as f:
+                f.write(message + "\n")
+        self.event("error", message=message, **fields)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h.counts), h.total, h.sum, h.buckets) for key, h in self._histograms.items()}
+
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in series}):
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for (n, key), value in sorted(series.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (n, key), (counts, total, total_sum, buckets) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, [('le', '+Inf')])} {total}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {total_sum:.6f}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port, host="127.0.0.1"):
+        """Serve /metrics on ``host:port`` from a daemon thread. Returns the bound port."""
+        if self._server is not None:
+            return self._server.server_address[1]
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        with self._log_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def load_metrics_settings():
+    return {"event_log": get_setting(load_settings(), "event_log", DEFAULT_EVENT_LOG)}
+
+
+def metrics_port_setting():
+    return get_setting(load_settings(), "metrics_port", 0, lambda port: int(port or 0))
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(**load_metrics_settings())
+        return _metrics
@@ -0,0 +1,306 @@
+"""
+Perceptual-hash index for finding near-duplicate images under ISdownloads.
+
+Each image gets a 64-bit difference hash (dHash) computed with NumPy in a
+process pool. Hashes live in flat arrays persisted to cache/phash.npz, which
+is only rewritten by scan() and close(). Hashes added in between are appended
+to a small cache/phash.delta journal and replayed on load.
+
+Near-duplicate search uses multi-index hashing: for a threshold of k bits the
+hash is cut into k + 1 blocks. Any two hashes within distance k agree exactly
+on at least one block (pigeonhole), so only hashes that share a block value
+are ever compared, instead of every pair in the index.
+"""
+import atexit, importlib.util, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# numpy and Pillow are optional and imported on first use, so importing this
+# module stays cheap for runs that never hash anything.
+np = None
+Image = None
+
+INDEX_FILE = Path("cache/phash.npz")
+DELTA_SUFFIX = ".delta"
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+HASH_SIZE = 8
+DEFAULT_THRESHOLD = 4
+SAVE_EVERY = 200
+ROW_CHUNK = 1024
+
+
+def available():
+    return importlib.util.find_spec("numpy") is not None and importlib.util.find_spec("PIL") is not None
+
+
+def _require():
+    global np, Image
+    if np is None:
+        import numpy
+        from PIL import Image as PILImage
+        np, Image = numpy, PILImage
+
+
+def dhash_file(path):
+    """Return the 64-bit dHash of the image at ``path``, or None if it can't be decoded."""
+    _require()
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            img = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+            pixels = np.asarray(img, dtype=np.int16)
+    except Exception:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _hash_entry(path):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return path, None, 0.0
+    return path, dhash_file(path), mtime
+
+
+_POPCOUNT_TABLE = None
+
+
+def popcount64(values):
+    global _POPCOUNT_TABLE
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    if _POPCOUNT_TABLE is None:
+        _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1)
+
+
+class PHashIndex:
+    def __init__(self, path=INDEX_FILE, workers=None):
+        _require()
+        self.path = Path(path)
+        self.delta_path = self.path.with_suffix(DELTA_SUFFIX)
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._paths = []
+        self._rows = {}
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._mtimes = np.zeros(0, dtype=np.float64)
+        self._pending = []
+        self._journal = []
+        self.load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._paths) + len(self._pending)
+
+    def load(self):
+        if self.path.exists():
+            with np.load(self.path, allow_pickle=False) as data:
+                self._hashes = data["hashes"].astype(np.uint64)
+                self._mtimes = data["mtimes"].astype(np.float64)
+                self._paths = [str(p) for p in data["paths"]]
+            self._rows = {p: i for i, p in enumerate(self._paths)}
+        if self.delta_path.exists():
+            with open(self.delta_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        value, mtime, path = line.rstrip("\n").split("\t", 2)
+                        self._put(path, int(value, 16), float(mtime))
+                    except ValueError:
+                        pass  # a line cut short by a crash
+
+    def save(self):
+        """Rewrite the whole index file and drop the journal."""
+        with self._lock:
+            self._compact()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp.npz")
+            np.savez(tmp, hashes=self._hashes, mtimes=self._mtimes,
+                     paths=np.array(self._paths, dtype=str))
+            os.replace(tmp, self.path)
+            self.delta_path.unlink(missing_ok=True)
+            self._journal = []
+
+    def _append_journal(self):
+        # Called with the lock held. Costs one short append per SAVE_EVERY
+        # hashes instead of rewriting every path in the index.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.delta_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{value:x}\t{mtime!r}\t{path}\n" for path, value, mtime in self._journal)
+        self._journal = []
+
+    def _compact(self):
+        # Appends are buffered in a list and folded into the arrays lazily.
+        if not self._pending:
+            return
+        new_paths, new_hashes, new_mtimes = zip(*self._pending)
+        self._pending = []
+        start = len(self._paths)
+        self._paths.extend(new_paths)
+        self._hashes = np.concatenate((self._hashes, np.array(new_hashes, dtype=np.uint64)))
+        self._mtimes = np.concatenate((self._mtimes, np.array(new_mtimes, dtype=np.float64)))
+        for i, p in enumerate(new_paths, start):
+            self._rows[p] = i
+
+    def _put(self, path, value, mtime):
+        row = self._rows.get(path)
+        if row == -1:
+            self._compact()
+            row = self._rows[path]
+        if row is not None:
+            self._hashes[row] = value
+            self._mtimes[row] = mtime
+        else:
+            self._rows[path] = -1
+            self._pending.append((path, value, mtime))
+
+    def add(self, path, value, mtime):
+        if value is None:
+            return
+        with self._lock:
+            self._put(path, value, mtime)
+            self._journal.append((path, value, mtime))
+            if len(self._journal) >= SAVE_EVERY:
+                self._append_journal()
+
+    def _remove(self, stale):
+        keep = np.array([p not in stale for p in self._paths], dtype=bool)
+        self._paths = [p for p in self._paths if p not in stale]
+        self._hashes = self._hashes[keep]
+        self._mtimes = self._mtimes[keep]
+        self._rows = {p: i for i, p in enumerate(self._paths)}
+
+    def _get_executor(self):
+        if self._executor is None:
+            # The pool is first started from the download engine's event-loop
+            # thread inside a multi-threaded (Qt) process, where fork() is
+            # unsafe, so workers start from a clean interpreter instead.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def hash_async(self, path):
+        """Hash ``path`` in the process pool and add it to the index when done."""
+        if not str(path).lower().endswith(IMAGE_EXTS):
+            return
+        future = self._get_executor().submit(_hash_entry, str(path))
+        future.add_done_callback(self._on_hashed)
+
+    def _on_hashed(self, future):
+        if future.exception() is None:
+            self.add(*future.result())
+
+    def scan(self, root, progress=None):
+        """
+        Bring the index up to date with every image under ``root``: hash new
+        or modified files and drop entries whose file no longer exists.
+        Returns the number of files hashed.
+        """
+        files = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.lower().endswith(IMAGE_EXTS):
+                    full = os.path.join(dirpath, name)
+                    try:
+                        files[full] = os.path.getmtime(full)
+                    except OSError:
+                        pass
+
+        with self._lock:
+            self._compact()
+            stale = set(p for p in self._paths if p not in files)
+            if stale:
+                self._remove(stale)
+            todo = [p for p, mtime in files.items()
+                    if p not in self._rows or self._mtimes[self._rows[p]] != mtime]
+
+        total = len(todo)
+        for done, (path, value, mtime) in enumerate(
+                self._get_executor().map(_hash_entry, todo, chunksize=64), 1):
+            self.add(path, value, mtime)
+            if progress:
+                progress(done, total)
+        self.save()
+        return total
+
+    def query(self, value, threshold=DEFAULT_THRESHOLD):
+        """Return ``(path, distance)`` for every indexed image within ``threshold`` bits of ``value``."""
+        with self._lock:
+            self._compact()
+            distances = popcount64(self._hashes ^ np.uint64(value))
+            hits = np.flatnonzero(distances <= threshold)
+            return [(self._paths[i], int(distances[i])) for i in hits]
+
+    def find_near_duplicates(self, threshold=DEFAULT_THRESHOLD):
+        """Group indexed images whose hashes are within ``threshold`` bits of each other."""
+        with self._lock:
+            self._compact()
+            hashes = self._hashes.copy()
+            paths = list(self._paths)
+        n = len(hashes)
+        if n < 2:
+            return []
+
+        parent = list(range(n))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # Exactly threshold + 1 blocks, or the pigeonhole argument fails. Past
+        # 64 the extra blocks are empty and put everything in one bucket.
+        spans = {(int(block[0]) if len(block) else 0, len(block))
+                 for block in np.array_split(np.arange(64), threshold + 1)}
+        for shift, bits in sorted(spans):
+            keys = (hashes >> np.uint64(shift)) & np.uint64((1 << bits) - 1)
+            order = np.argsort(keys, kind="stable")
+            bounds = np.flatnonzero(np.diff(keys[order])) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [n]))
+            for b in np.flatnonzero(ends - starts > 1):
+                bucket = order[starts[b]:ends[b]]
+                for i, j in self._close_pairs(hashes, bucket, threshold):
+                    ri, rj = find(i), find(j)
+                    if ri != rj:
+                        parent[ri] = rj
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(paths[i])
+        return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=len, reverse=True)
+
+    def _close_pairs(self, hashes, bucket, threshold):
+        values = hashes[bucket]
+        for start in range(0, len(bucket), ROW_CHUNK):
+            rows = bucket[start:start + ROW_CHUNK]
+            distances = popcount64(values[start:start + ROW_CHUNK, None] ^ values[None, :])
+            ri, ci = np.nonzero(distances <= threshold)
+            for i, j in zip(rows[ri], bucket[ci]):
+                if i < j:
+                    yield int(i), int(j)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._journal or self.delta_path.exists():
+            self.save()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_phash_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PHashIndex()
+            atexit.register(_index.close)
+        return _index
@@ -0,0 +1,147 @@
+"""
+Byte-level progress for one job, published at a bounded rate.
+
+The download engine reports every chunk and finished file here. Those calls
+only update counters under a lock. A snapshot with overall percent,
+throughput and ETA is handed to ``publish`` at most ``1 / interval`` times a
+second (10 Hz by default), plus once when the last queued file finishes.
+A job that moves thousands of chunks therefore costs the GUI a handful of
+cross-thread signals per second, not one per chunk.
+
+Files whose size isn't known yet (not started, or no Content-Length) count
+as the average size of the files that are, so the percentage tracks bytes
+rather than file count.
+"""
+import threading, time
+
+PUBLISH_INTERVAL = 0.1
+RATE_WINDOW = 5.0
+
+
+class ProgressAggregator:
+    def __init__(self, publish, expected_files=0, interval=PUBLISH_INTERVAL):
+        self.publish = publish
+        self.expected_files = expected_files
+        self.interval = interval
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_sized = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.started = time.monotonic()
+        self._samples = [(self.started, 0)]
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+
+    def add_files(self, count=1):
+        with self._lock:
+            self.files_total += count
+
+    def file(self):
+        """Byte counter for one download; see FileProgress."""
+        return FileProgress(self)
+
+    def _adjust(self, sized=0, total=0, done=0):
+        with self._lock:
+            self.files_sized += sized
+            self.bytes_total += total
+            self.bytes_done += done
+        self._maybe_publish()
+
+    def file_finished(self, ok=True):
+        with self._lock:
+            self.files_done += 1
+            if not ok:
+                self.files_failed += 1
+        self._maybe_publish(force=self.files_done >= self.files_total)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            while len(self._samples) > 1 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.pop(0)
+            if now - self._samples[-1][0] >= self.interval:
+                self._samples.append((now, self.bytes_done))
+            first_time, first_bytes = self._samples[0]
+            elapsed = now - first_time
+            rate = (self.bytes_done - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+            files = max(self.files_total, self.expected_files)
+            average = self.bytes_total / self.files_sized if self.files_sized else 0
+            estimated = self.bytes_total + average * max(0, files - self.files_sized)
+            if estimated:
+                # Failed files never deliver their bytes; count them as done.
+                failed = average * self.files_failed
+                fraction = min(1.0, (self.bytes_done + failed) / estimated)
+            else:
+                fraction = self.files_done / files if files else 0.0
+            remaining = max(0.0, estimated - self.bytes_done)
+
+            return {
+                "percent": int(fraction * 100),
+                "files_done": self.files_done,
+                "files_failed": self.files_failed,
+                "files_total": files,
+                "bytes_done": self.bytes_done,
+                "bytes_total": int(estimated),
+                "bytes_per_sec": round(rate),
+                "eta": round(remaining / rate) if rate > 0 and estimated else None,
+                "elapsed": round(now - self.started, 1),
+            }
+
+    def _maybe_publish(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_publish < self.interval:
+                return
+            self._last_publish = now
+        self.publish(self.snapshot())
+
+    def finish(self):
+        """Publish the final state regardless of throttling."""
+        self._maybe_publish(force=True)
+
+
+class FileProgress:
+    """
+    One file's share of a job's bytes. A retry that starts over calls
+    ``expect`` again, which takes back what the failed attempt had counted.
+    """
+
+    def __init__(self, aggregator):
+        self.aggregator = aggregator
+        self.size = None
+        self.done = 0
+
+    def expect(self, size, already=0):
+        """The file is ``size`` bytes in total, ``already`` of them on disk from an earlier run."""
+        self.reset()
+        self.size = size
+        self.done = already
+        self.aggregator._adjust(sized=1 if size is not None else 0, total=size or 0, done=already)
+
+    def add(self, count):
+        self.done += count
+        self.aggregator._adjust(done=count)
+
+    def reset(self):
+        if self.size is not None or self.done:
+            self.aggregator._adjust(sized=-1 if self.size is not None else 0, total=-(self.size or 0), done=-self.done)
+        self.size = None
+        self.done = 0
+
+
+def format_rate(bytes_per_sec):
+    for unit in ("B", "KB", "MB", "GB"):
+        if bytes_per_sec < 1024 or unit == "GB":
+            return f"{bytes_per_sec:.0f} {unit}/s" if unit == "B" else f"{bytes_per_sec:.1f} {unit}/s"
+        bytes_per_sec /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes:02}:{seconds:02}"
@@ -0,0 +1,179 @@
+"""
+Process-wide per-host rate limiter.
+
+Every request -- page fetches, API calls, HEAD probes and media downloads,
+from any job -- takes a token from its host's bucket first. When any request
+sees a 429 or 503 the whole host is paused for Retry-After (or an exponential
+delay) and its rate is halved. Successful responses then raise the rate back
+towards the configured ceiling step by step. Every job hitting that host
+shares the same backoff, so throughput settles at the host's real limit
+instead of swinging between bans and idle time.
+"""
+import asyncio, threading, time
+from email.utils import parsedate_to_datetime
+from settings import load_settings, get_setting
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+MIN_RATE = 0.2
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 300.0
+
+# Requests per second. The 4chan API asks for no more than one per second.
+HOST_RATES = {
+    "a.4cdn.org": 1.0,
+    "i.4cdn.org": 20.0,
+    "i.redd.it": 20.0,
+    "preview.redd.it": 20.0,
+    "oauth.reddit.com": 1.5,
+    "www.reddit.com": 1.0,
+    "fapello.com": 2.0,
+    "motherless.com": 4.0,
+    "cdn5-images.motherlessmedia.com": 20.0,
+    "www.erome.com": 4.0,
+}
+
+BACKOFF_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header as seconds, or None if missing or unparseable."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backed_off_at = 0.0
+        self.strikes = 0
+
+    def reserve(self, now):
+        """Take a token and return how long the caller must wait before using it."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+class RateLimiter:
+    def __init__(self, default_rate=DEFAULT_RATE, burst=DEFAULT_BURST, rates=None):
+        self.default_rate = default_rate
+        self.burst = burst
+        self.rates = dict(HOST_RATES)
+        self.rates.update(rates or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate = self.rates.get(host, self.default_rate)
+            bucket = self._buckets[host] = TokenBucket(rate, max(1, min(self.burst, int(rate * 2))))
+        return bucket
+
+    def reserve(self, host):
+        with self._lock:
+            return self._bucket(host).reserve(time.monotonic())
+
+    def recheck(self, host, reserved_at):
+        """
+        Further wait for a token reserved at ``reserved_at`` once its delay is
+        over. A backoff since then cancelled the token, so a new one is taken at
+        the lowered rate; a pause is waited out.
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            if bucket.backed_off_at > reserved_at:
+                return now, bucket.reserve(now)
+            return reserved_at, max(0.0, bucket.blocked_until - now)
+
+    def acquire(self, host):
+        reserved_at = time.monotonic()
+        delay = self.reserve(host)
+        while delay > 0:
+            time.sleep(delay)
+            reserved_at, delay = self.recheck(host, reserved_at)
+
+    async def acquire_async(self, host):
+        reserved_at = time.monotonic()
+        delay = self.reserve(host)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            reserved_at, delay = self.recheck(host, reserved_at)
+
+    def backoff(self, host, retry_after=None):
+        """Pause ``host`` for every caller and halve its rate after a 429/503."""
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.strikes += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (bucket.strikes - 1))
+            now = time.monotonic()
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+            bucket.backed_off_at = now
+            bucket.rate = max(MIN_RATE, bucket.rate / 2)
+            # Tokens already handed out are void and their holders queue again.
+            # The bucket starts refilling only once the pause is over.
+            bucket.tokens = 0
+            bucket.updated = bucket.blocked_until
+            return delay
+
+    def pause(self, host, seconds):
+        """Hold every request to ``host`` for ``seconds`` without touching its rate."""
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+    def record_success(self, host):
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.strikes = 0
+            if bucket.rate < bucket.max_rate:
+                bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate / 20)
+
+    def snapshot(self):
+        """Current rate (req/s) and remaining pause (s) for every host seen so far."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                host: {"rate": round(b.rate, 2), "max_rate": b.max_rate,
+                       "paused_for": round(max(0.0, b.blocked_until - now), 1)}
+                for host, b in self._buckets.items()
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def load_limiter_settings():
+    data = load_settings()
+    return {
+        "default_rate": get_setting(data, "default_host_rate", DEFAULT_RATE, float),
+        "rates": get_setting(data, "host_rates", {}, lambda rates: {k: float(v) for k, v in rates.items()}),
+    }
+
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(**load_limiter_settings())
+        return _limiter
@@ -0,0 +1,47 @@
+"""
+Site downloaders, one module per site.
+
+A site's module is only imported when a job for that site is created, so a run
+that only touches 4chan never loads selenium, praw or BeautifulSoup.
+"""
+import importlib, re
+
+
+def _site(name):
+    return importlib.import_module(f"scrapers.{name}")
+
+
+def create_download_thread(url, limit=10, sort="hot", media_type="both", download_all=False, watch=False):
+    """
+    Build the Download*Thread for ``url``. ``download_all`` lifts the limit for
+    Reddit user jobs and ``watch`` keeps polling a 4chan thread for new posts.
+    Raises ValueError for unsupported or malformed sources.
+    """
+    url = url.strip()
+
+    if "4chan.org" in url:
+        return _site("fourchan").Download4chanThread(url, watch=watch)
+    elif "erome.com" in url:
+        return _site("erome").DownloadEromeThread(url)
+    elif "fapello.com" in url:
+        return _site("fapello").DownloadFapelloThread(url, media_type)
+    elif "motherless.com" in url:
+        return _site("motherless").DownloadMotherlessThread(url)
+    elif "reddit.com/user/" in url:
+        match = re.search(r"reddit\.com/user/([^/]+)/?", url)
+        if not match:
+            raise ValueError("Could not extract Reddit username.")
+        return _site("reddit").DownloadRedditUserThread(match.group(1), None if download_all else limit, sort)
+    elif re.match(r"^(https?://)?(www\.)?reddit\.com|^r/", url):
+        subreddit = url.split("/")[-1] if "/" in url else url.replace("r/", "").strip()
+        return _site("reddit").DownloadRedditThread(subreddit, limit, sort)
+    elif re.match(r"^u\/[A-Za-z0-9_-]+\/?$", url):
+        username = url.replace("u/", "").replace("/", "").strip()
+        return _site("reddit").DownloadRedditUserThread(username, None if download_all else limit, sort)
+
+    raise ValueError("Unsupported URL or feature not implemented yet.")
+
+
+def create_reddit_sync_thread(subreddits, limit=10, sort="new", max_in_flight=4):
+    """Build one job that incrementally syncs every subreddit in ``subreddits``."""
+    return _site("reddit").DownloadRedditSyncThread(subreddits, limit, sort, max_in_flight)
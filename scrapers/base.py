@@ -0,0 +1,156 @@
+"""
+Thread and signal classes shared by every site downloader.
+
+Under the GUI these are PyQt5's QThread and pyqtSignal. The headless CLI sets
+IMAGESCRAPER_HEADLESS=1 before importing any scraper, which swaps in a small
+threading-based stand-in with the same surface, so the Download*Thread classes
+run unchanged without importing Qt or needing a display.
+"""
+import os, re, threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from metrics import get_metrics
+from progress import ProgressAggregator
+
+HEADLESS = os.environ.get("IMAGESCRAPER_HEADLESS") == "1"
+
+if not HEADLESS:
+    try:
+        from PyQt5.QtCore import QThread, pyqtSignal
+    except ImportError:
+        HEADLESS = True
+
+if HEADLESS:
+    class _BoundSignal:
+        def __init__(self):
+            self._slots = []
+
+        def connect(self, slot):
+            self._slots.append(slot)
+
+        def disconnect(self, slot=None):
+            if slot is None:
+                self._slots.clear()
+            else:
+                self._slots.remove(slot)
+
+        def emit(self, *args):
+            for slot in list(self._slots):
+                slot(*args)
+
+    class pyqtSignal:
+        def __init__(self, *types):
+            self.name = None
+
+        def __set_name__(self, owner, name):
+            self.name = name
+
+        def __get__(self, obj, objtype=None):
+            if obj is None:
+                return self
+            # Cached on the instance, so later lookups skip this descriptor.
+            signal = obj.__dict__[self.name] = _BoundSignal()
+            return signal
+
+    class QThread:
+        started = pyqtSignal()
+        finished = pyqtSignal()
+
+        def __init__(self, parent=None):
+            self._thread = None
+            self._interrupted = False
+
+        def run(self):
+            pass
+
+        def _bootstrap(self):
+            self.started.emit()
+            try:
+                self.run()
+            finally:
+                self.finished.emit()
+
+        def start(self):
+            self._interrupted = False
+            self._thread = threading.Thread(target=self._bootstrap, name=type(self).__name__, daemon=True)
+            self._thread.start()
+
+        def wait(self, msecs=None):
+            if self._thread is None:
+                return True
+            self._thread.join(None if msecs is None else msecs / 1000)
+            return not self._thread.is_alive()
+
+        def isRunning(self):
+            return self._thread is not None and self._thread.is_alive()
+
+        def isFinished(self):
+            return self._thread is not None and not self._thread.is_alive()
+
+        def requestInterruption(self):
+            self._interrupted = True
+
+        def isInterruptionRequested(self):
+            return self._interrupted
+
+
+class DownloadThread(QThread):
+    """
+    Base of the site Download*Thread classes. A ``run`` that ends in ``fail``
+    leaves ``error`` set, which the scheduler reports as a failed job.
+    """
+    cache_name = None
+    error = None
+
+    def log_to_file(self, message):
+        get_metrics().error(message, site=self.cache_name)
+
+    def fail(self, source, error):
+        self.error = str(error)
+        self.log_message.emit(f"❌ Error: {error}")
+        self.log_to_file(f"❌ {source}: {error}")
+
+
+def job_progress(thread, expected_files=0):
+    """
+    A ProgressAggregator that reports to ``thread``: the percentage on
+    progress_updated and the full snapshot (bytes, rate, ETA) on progress_stats.
+    """
+    def publish(snapshot):
+        thread.progress_updated.emit(snapshot["percent"])
+        thread.progress_stats.emit(snapshot)
+    return ProgressAggregator(publish, expected_files=expected_files)
+
+
+def find_last_page(soup):
+    """Highest ?page=N linked from a paginated listing's parsed HTML (1 if none)."""
+    pages = [1]
+    for a in soup.select("a[href*='page=']"):
+        match = re.search(r"[?&]page=(\d+)", a.get("href", ""))
+        if match:
+            pages.append(int(match.group(1)))
+    return max(pages)
+
+
+def crawl_pages(pool, fetch_page, last_page, log):
+    """
+    Run ``fetch_page(page)`` for pages 1..``last_page`` on ``pool`` and yield
+    each result as it finishes. ``fetch_page`` returns ``(result, highest
+    page linked from that page)``: windowed paginators only link a few pages
+    ahead, so pages found that way are crawled too until none are left.
+    """
+    pending = {pool.submit(fetch_page, page) for page in range(1, last_page + 1)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result, linked = future.result()
+            except Exception as e:
+                log(f"⚠️ Page failed: {e}")
+                continue
+            if linked > last_page:
+                pending.update(pool.submit(fetch_page, page) for page in range(last_page + 1, linked + 1))
+                last_page = linked
+            yield result
+
+
+SUPPORTED_EXTS = ['.jpg', '.png', '.gif', '.webm']
@@ -0,0 +1,160 @@
+import http_client
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup
+from pathlib import Path
+from urllib.parse import urlparse, urljoin
+from http_client import HEADERS
+from download_engine import get_engine
+from cache_store import get_store
+from scrapers.base import DownloadThread, pyqtSignal, job_progress, find_last_page, crawl_pages
+
+# Profile mode: listing pages and album pages fetched at once, and downloads
+# queued ahead of the engine while albums are still being read.
+PAGE_WORKERS = 4
+MAX_PENDING = 128
+
+
+class DownloadEromeThread(DownloadThread):
+    base_folder = Path("ISdownloads/erome")
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = "erome"
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def sanitize_filename(self, url):
+        path = urlparse(url).path
+        return Path(path).name
+
+    def filter_cached(self, urls):
+        return get_store().filter_new(self.cache_name, urls)
+
+    def update_cache(self, urls):
+        get_store().add_many(self.cache_name, urls)
+
+    def run(self):
+        try:
+            if "/a/" in urlparse(self.url).path:
+                self.scrape_erome_gallery(self.url)
+            else:
+                self.scrape_erome_profile(self.url)
+        except Exception as e:
+            self.fail(self.url, e)
+
+    def open_batch(self):
+        return get_engine().open_batch(
+            headers=HEADERS,
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+            max_pending=MAX_PENDING,
+        )
+
+    def album_media(self, soup):
+        media_urls = set()
+        for div in soup.select('div.img[data-src]'):
+            src = div.get('data-src')
+            if src and src.startswith("https"):
+                media_urls.add(src)
+        for source in soup.select('video > source[src]'):
+            src = source.get('src')
+            if src and src.startswith("https"):
+                media_urls.add(src)
+        return media_urls
+
+    def queue_album(self, batch, url, soup, folder):
+        """Queue an album's uncached media, with the album as Referer. Returns how many were new."""
+        media_urls = self.filter_cached(self.album_media(soup))
+        if media_urls:
+            folder.mkdir(parents=True, exist_ok=True)
+        for u in media_urls:
+            batch.add(u, folder / self.sanitize_filename(u), {"Referer": url})
+        return len(media_urls)
+
+    def scrape_erome_gallery(self, url):
+        self.log_message.emit(f"Scraping gallery: {url}")
+        response = http_client.get(url, headers=HEADERS)
+        if response.status_code != 200:
+            self.log_message.emit(f"❌ Failed to access gallery ({response.status_code})")
+            return
+
+        soup = BeautifulSoup(response.text, "html.parser")
+        gallery_id = url.rstrip("/").split("/")[-1]
+        folder = self.base_folder / gallery_id
+
+        batch = self.open_batch()
+        self.log_message.emit(f"Found {self.queue_album(batch, url, soup, folder)} new media files.")
+        self.update_cache(batch.close())
+        self.log_message.emit(f"✅ Finished downloading to: {folder.resolve()}")
+
+    def profile_albums(self, soup, base_url):
+        return [urljoin(base_url, a["href"]) for a in soup.select("a[href*='/a/']") if a.get("href")]
+
+    def scrape_erome_profile(self, url):
+        # Listing pages are read PAGE_WORKERS at a time and every album found
+        # is fetched by the same pool; each album's media goes straight into
+        # one shared batch, so downloads run while the crawl continues.
+        username = urlparse(url).path.strip("/").split("/")[0]
+        if not username:
+            raise ValueError("Could not extract Erome username.")
+        profile_url = f"https://www.erome.com/{username}"
+        self.log_message.emit(f"🔍 Crawling profile: {profile_url}")
+
+        response = http_client.get(profile_url, headers=HEADERS)
+        if response.status_code != 200:
+            self.log_message.emit(f"❌ Failed to access profile ({response.status_code})")
+            return
+        first_page = BeautifulSoup(response.text, "html.parser")
+        last_page = find_last_page(first_page)
+        self.log_message.emit(f"📄 Profile links {last_page} page(s)")
+
+        batch = self.open_batch()
+        seen_albums = set()
+
+        def fetch_album(album_url):
+            if self.isInterruptionRequested():
+                return 0
+            response = http_client.get(album_url, headers=HEADERS)
+            if response.status_code != 200:
+                self.log_message.emit(f"⚠️ Album failed ({response.status_code}): {album_url}")
+                return 0
+            folder = self.base_folder / username / album_url.rstrip("/").split("/")[-1]
+            return self.queue_album(batch, album_url, BeautifulSoup(response.text, "html.parser"), folder)
+
+        def fetch_page(page):
+            # Also returns the highest page this one links to, so pages past
+            # the first page's pagination window are crawled too.
+            if page == 1:
+                page_soup = first_page
+            elif self.isInterruptionRequested():
+                return [], 0
+            else:
+                response = http_client.get(profile_url, params={"page": page}, headers=HEADERS)
+                if response.status_code != 200:
+                    self.log_message.emit(f"⚠️ Profile page {page} failed ({response.status_code})")
+                    return [], 0
+                page_soup = BeautifulSoup(response.text, "html.parser")
+            return self.profile_albums(page_soup, profile_url), find_last_page(page_soup)
+
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pages, \
+                ThreadPoolExecutor(max_workers=PAGE_WORKERS) as albums:
+            album_futures = []
+            for found in crawl_pages(pages, fetch_page, last_page, self.log_message.emit):
+                for album_url in found:
+                    if album_url not in seen_albums:
+                        seen_albums.add(album_url)
+                        album_futures.append(albums.submit(fetch_album, album_url))
+
+            new_files = 0
+            for future in album_futures:
+                try:
+                    new_files += future.result()
+                except Exception as e:
+                    self.log_message.emit(f"⚠️ Album failed: {e}")
+
+        self.log_message.emit(f"📁 {len(seen_albums)} albums, {new_files} new media files queued")
+        self.update_cache(batch.close())
+        self.log_message.emit(f"✅ Finished downloading profile: {username}")
@@ -0,0 +1,196 @@
+import os, queue, threading
+from pathlib import Path
+from urllib.parse import urlparse
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from browser_pool import get_browser_pool
+from download_engine import get_engine
+from cache_store import get_store
+from rate_limit import get_rate_limiter
+from scrapers.base import DownloadThread, pyqtSignal, job_progress
+
+# Post pages are opened by this many workers at once (each borrows a browser
+# from the shared pool per page, so the pool size is the real cap), and at
+# most MAX_PENDING media files wait in the download queue before they block.
+POST_WORKERS = 3
+MAX_PENDING = 64
+MAX_SCROLLS = 30
+# Explicit waits (seconds) replacing the old fixed sleeps: how long a page may
+# take to show its links or media, and how long a scroll may take to load more.
+PAGE_WAIT = 10
+SCROLL_WAIT = 4
+
+# Media and links are read straight from the live DOM. With the pool's
+# lightweight profile the browser never fetches the images themselves, but
+# their src attributes are still there.
+POST_LINKS_JS = """
+return Array.from(document.querySelectorAll(arguments[0]), a => {
+    const div = a.parentElement && a.parentElement.closest('div');
+    return [a.getAttribute('href'), !!(div && div.querySelector("img[src*='icon-play.svg']"))];
+});
+"""
+POST_MEDIA_JS = """
+return [
+    Array.from(document.querySelectorAll("img[src*='/content/']"), e => e.getAttribute('src')),
+    Array.from(document.querySelectorAll("video > source[src*='/content/']"), e => e.getAttribute('src')),
+];
+"""
+
+
+class DownloadFapelloThread(DownloadThread):
+    base_folder = Path("ISdownloads/fapello")
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = "fapello"
+
+    def __init__(self, url, media_type):
+        super().__init__()
+        self.url = url
+        self.media_type = media_type
+
+    def sanitize_filename(self, url):
+        return os.path.basename(urlparse(url).path.split("?")[0])
+
+    def filter_cached(self, urls):
+        return get_store().filter_new(self.cache_name, urls)
+
+    def update_cache(self, urls):
+        get_store().add_many(self.cache_name, urls)
+
+    def run(self):
+        try:
+            self.scrape_fapello_profile(self.url, self.media_type)
+        except Exception as e:
+            self.fail(self.url, e)
+
+    def open_page(self, driver, url):
+        get_rate_limiter().acquire(urlparse(url).hostname)
+        driver.get(url)
+
+    def wait_for(self, driver, timeout, condition):
+        """Return the first truthy ``condition(driver)`` within ``timeout`` seconds, else None."""
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=0.2).until(condition)
+        except TimeoutException:
+            return None
+
+    def find_post_links(self, driver, username, media_type):
+        post_links = []
+
+        for href, has_play_icon in driver.execute_script(POST_LINKS_JS, f"a[href^='https://fapello.com/{username}/']"):
+            if media_type == "videos" and not has_play_icon:
+                continue
+            if media_type == "images" and has_play_icon:
+                continue
+
+            post_links.append(href)
+        return post_links
+
+    def find_post_media(self, driver, username, media_type):
+        images, videos = driver.execute_script(POST_MEDIA_JS)
+        media_urls = set()
+
+        if media_type in ("both", "images"):
+            media_urls.update(src for src in images if src and username in src and '_300px' not in src)
+
+        if media_type in ("both", "videos"):
+            media_urls.update(src for src in videos if src and username in src)
+        return media_urls
+
+    def scroll_profile(self, driver, profile_url, on_page):
+        """Scroll the profile to the bottom, calling ``on_page(driver)`` after every step."""
+        self.log_message.emit(f"🔍 Opening profile: {profile_url}")
+        self.open_page(driver, profile_url)
+        self.wait_for(driver, PAGE_WAIT, lambda d: d.execute_script(
+            "return document.querySelector(\"a[href*='fapello.com/']\") !== null"))
+        on_page(driver)
+
+        scroll_height = "return document.body.scrollHeight"
+        last_height = driver.execute_script(scroll_height)
+        scroll_attempts = 0
+
+        def grown(d):
+            height = d.execute_script(scroll_height)
+            return height if height > last_height else None
+
+        while scroll_attempts < MAX_SCROLLS and not self.isInterruptionRequested():
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            new_height = self.wait_for(driver, SCROLL_WAIT, grown)
+            if not new_height:
+                break
+            on_page(driver)
+            last_height = new_height
+            scroll_attempts += 1
+
+    def scrape_fapello_profile(self, profile_url, media_type):
+        # Three stages run at the same time: the profile page is scrolled and
+        # every newly revealed post link is queued at once; POST_WORKERS
+        # workers open those posts in parallel on browsers borrowed from the
+        # shared pool; and each media URL goes
+        # straight into a bounded download batch, so the first files arrive
+        # while the profile is still being scrolled.
+        username = profile_url.rstrip("/").split("/")[-1]
+        folder = self.base_folder / username
+        folder.mkdir(parents=True, exist_ok=True)
+
+        batch = get_engine().open_batch(
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+            max_pending=MAX_PENDING,
+        )
+        posts = queue.Queue()
+        seen_media = set()
+        seen_lock = threading.Lock()
+
+        pool = get_browser_pool()
+
+        def post_worker():
+            while not self.isInterruptionRequested():
+                post_url = posts.get()
+                if post_url is None:
+                    break
+                try:
+                    self.log_message.emit(f"🔗 Opening post: {post_url}")
+                    with pool.browser() as driver:
+                        self.open_page(driver, post_url)
+                        found = self.wait_for(
+                            driver, PAGE_WAIT, lambda d: self.find_post_media(d, username, media_type)
+                        ) or set()
+                except Exception as e:
+                    self.log_message.emit(f"❌ Failed to scrape post {post_url}: {e}")
+                    continue
+                with seen_lock:
+                    found -= seen_media
+                    seen_media.update(found)
+                for url in self.filter_cached(found):
+                    batch.add(url, folder / self.sanitize_filename(url))
+
+        workers = [threading.Thread(target=post_worker, daemon=True) for _ in range(POST_WORKERS)]
+        for worker in workers:
+            worker.start()
+
+        queued_posts = set()
+
+        def queue_new_posts(driver):
+            for link in self.find_post_links(driver, username, media_type):
+                if link not in queued_posts:
+                    queued_posts.add(link)
+                    posts.put(link)
+
+        try:
+            with pool.browser() as driver:
+                self.scroll_profile(driver, profile_url, queue_new_posts)
+            self.log_message.emit(f"📄 Found {len(queued_posts)} posts, waiting for post workers...")
+        finally:
+            # Also when the profile page fails: finish the posts already
+            # queued and record their files, or the next run fetches them again.
+            for _ in workers:
+                posts.put(None)
+            for worker in workers:
+                worker.join()
+            downloaded_urls = batch.close()
+            self.update_cache(downloaded_urls)
+
+        self.log_message.emit(f"✅ Finished downloading from profile: {username} ({len(downloaded_urls)} new files)")
@@ -0,0 +1,333 @@
+import heapq, itertools, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from http_client import HEADERS
+from download_engine import get_engine
+from cache_store import get_store
+from scrapers.base import DownloadThread, pyqtSignal, job_progress, SUPPORTED_EXTS
+
+# The 4chan API asks clients to wait at least 10 seconds between thread updates.
+WATCH_MIN_INTERVAL = 10
+WATCH_MAX_INTERVAL = 300
+# Board mode: thread JSON fetches in flight at once (the API limiter still
+# spaces them out) and downloads queued ahead of the engine.
+BOARD_FETCH_WORKERS = 4
+BOARD_MAX_PENDING = 256
+
+
+class Download4chanThread(DownloadThread):
+    base_folder = Path("ISdownloads/4chan")
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = "4chan"
+
+    def __init__(self, url, watch=False):
+        super().__init__()
+        self.url = url
+        self.watch = watch
+        # A thread watch mostly waits on the shared ThreadWatcher, so it runs
+        # outside the scheduler's worker slots instead of blocking one for
+        # the thread's whole life.
+        self.holds_slot = not (watch and self.parse_4chan_board_url(url) is None)
+
+    def run(self):
+        try:
+            board = self.parse_4chan_board_url(self.url)
+            if board:
+                self.archive_4chan_board(board)
+            elif self.watch:
+                self.watch_4chan_thread(self.url)
+            else:
+                self.download_4chan_thread(self.url)
+        except Exception as e:
+            self.fail(self.url, e)
+
+    def parse_4chan_thread_url(self, url):
+        match = re.search(r'boards\.4chan(?:nel)?\.org/(\w+)/thread/(\d+)', url)
+        if not match:
+            raise ValueError("Invalid 4chan thread URL")
+        return match.group(1), match.group(2)
+
+    def parse_4chan_board_url(self, url):
+        """Return the board name for a board or catalog URL, None for anything else."""
+        match = re.search(r'boards\.4chan(?:nel)?\.org/(\w+)/?(?:catalog/?)?(?:[?#].*)?$', url)
+        return match.group(1) if match else None
+
+    def fetch_4chan_thread_data(self, board, thread_id):
+        api_url = f"https://a.4cdn.org/{board}/thread/{thread_id}.json"
+        status, data = get_engine().fetch_json(api_url, headers=HEADERS)
+        if status != 200:
+            raise Exception(f"Failed to fetch thread data ({status})")
+        return data
+
+    def get_4chan_media_url(self, board, tim, ext):
+        return f"https://i.4cdn.org/{board}/{tim}{ext}"
+
+    def filter_cached(self, urls):
+        return get_store().filter_new(self.cache_name, urls)
+
+    def update_cache(self, urls):
+        get_store().add_many(self.cache_name, urls)
+
+    def collect_media(self, board, posts, folder):
+        downloads = []
+        for post in posts:
+            if "tim" in post and "ext" in post:
+                ext = post["ext"].lower()
+                if ext in SUPPORTED_EXTS:
+                    media_url = self.get_4chan_media_url(board, post["tim"], ext)
+                    save_path = folder / f"{post['tim']}{ext}"
+                    downloads.append((media_url, save_path))
+
+        new_urls = set(self.filter_cached(url for url, _ in downloads))
+        return [(url, path) for url, path in downloads if url in new_urls]
+
+    def download_media(self, downloads):
+        downloaded_urls = get_engine().download(
+            downloads,
+            headers=HEADERS,
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+        )
+        self.update_cache(downloaded_urls)
+        return downloaded_urls
+
+    def download_4chan_thread(self, url):
+        board, thread_id = self.parse_4chan_thread_url(url)
+        folder = self.base_folder / board / thread_id
+        folder.mkdir(parents=True, exist_ok=True)
+
+        thread_data = self.fetch_4chan_thread_data(board, thread_id)
+        downloads = self.collect_media(board, thread_data.get("posts", []), folder)
+
+        total = len(downloads)
+        if total == 0:
+            self.log_message.emit("No new media to download.")
+            return
+
+        self.log_message.emit(f"Found {total} new files. Downloading...")
+        self.download_media(downloads)
+        self.log_message.emit(f"✅ Download complete: {folder}")
+
+    def archive_4chan_board(self, board):
+        # catalog.json carries every live thread with its last_modified and
+        # image count, so one request tells us which threads changed since the
+        # previous run. Threads whose image count didn't move only need the OP
+        # from the catalog; the rest are fetched and all of their media goes
+        # into a single bounded batch shared by the whole board.
+        store = get_store()
+        namespace = f"{self.cache_name}:{board}"
+        status, pages = get_engine().fetch_json(f"https://a.4cdn.org/{board}/catalog.json", headers=HEADERS)
+        if status != 200:
+            raise Exception(f"Failed to fetch catalog for /{board}/ ({status})")
+
+        threads = [t for page in pages for t in page.get("threads", [])]
+        previous = store.get_state_map(namespace)
+        changed = []
+        for op in threads:
+            marker = f"{op.get('last_modified', 0)}:{op.get('images', 0)}"
+            if previous.get(str(op["no"])) != marker:
+                changed.append((op, marker))
+
+        self.log_message.emit(f"📚 /{board}/: {len(threads)} threads, {len(changed)} changed since last run")
+        if not changed:
+            self.progress_updated.emit(100)
+            return
+
+        batch = get_engine().open_batch(
+            headers=HEADERS,
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+            max_pending=BOARD_MAX_PENDING,
+        )
+
+        def thread_posts(op):
+            thread_id = str(op["no"])
+            if str(previous.get(thread_id, "")).endswith(f":{op.get('images', 0)}"):
+                return [op]
+            status, data = get_engine().fetch_json(
+                f"https://a.4cdn.org/{board}/thread/{thread_id}.json", headers=HEADERS
+            )
+            if status == 404:
+                return None
+            if status != 200:
+                raise Exception(f"thread {thread_id} ({status})")
+            return data.get("posts", [])
+
+        queued = {}
+        with ThreadPoolExecutor(max_workers=BOARD_FETCH_WORKERS) as pool:
+            futures = [(op, marker, pool.submit(thread_posts, op)) for op, marker in changed]
+            for op, marker, future in futures:
+                if self.isInterruptionRequested():
+                    future.cancel()
+                    continue
+                try:
+                    posts = future.result()
+                except Exception as e:
+                    self.log_message.emit(f"⚠️ Skipping {e}")
+                    continue
+                if posts is None:
+                    continue
+                folder = self.base_folder / board / str(op["no"])
+                downloads = self.collect_media(board, posts, folder)
+                if downloads:
+                    folder.mkdir(parents=True, exist_ok=True)
+                    batch.add_many(downloads)
+                queued[str(op["no"])] = (marker, [url for url, _ in downloads])
+
+        downloaded = set(batch.close())
+        self.update_cache(downloaded)
+
+        # A thread is only marked done once every file it queued arrived, so a
+        # cancelled or partly failed run picks the rest up next time.
+        finished = {tid: marker for tid, (marker, urls) in queued.items()
+                    if all(url in downloaded for url in urls)}
+        store.set_state_many(namespace, finished)
+        self.progress_updated.emit(100)
+        self.log_message.emit(
+            f"✅ /{board}/ archived: {len(downloaded)} new files from {len(finished)} threads"
+        )
+
+    def watch_4chan_thread(self, url):
+        # The shared ThreadWatcher does the polling; this job only waits for
+        # the watch to end and then for the downloads it queued.
+        board, thread_id = self.parse_4chan_thread_url(url)
+        watch = ThreadWatch(self, board, thread_id)
+        self.log_message.emit(f"👀 Watching /{board}/{thread_id}")
+        get_thread_watcher().add(watch)
+        while not watch.finished.wait(1):
+            if self.isInterruptionRequested():
+                break
+        watch.batch.close()
+        self.progress_updated.emit(100)
+        self.log_message.emit(f"✅ Watch finished: {watch.folder}")
+
+
+class ThreadWatch:
+    """
+    One watched thread. Polls with If-Modified-Since so an unchanged thread
+    costs a 304 and no body. Only posts newer than the last seen "no" are
+    looked at, and the poll interval doubles while nothing changes.
+    """
+
+    def __init__(self, job, board, thread_id):
+        self.job = job
+        self.board = board
+        self.folder = job.base_folder / board / thread_id
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.api_url = f"https://a.4cdn.org/{board}/thread/{thread_id}.json"
+        self.last_modified = None
+        self.last_no = 0
+        self.interval = WATCH_MIN_INTERVAL
+        self.finished = threading.Event()
+        self.batch = get_engine().open_batch(
+            headers=HEADERS,
+            on_result=self.downloaded,
+            progress=job_progress(job),
+            log=job.log_message.emit,
+            should_stop=job.isInterruptionRequested,
+        )
+
+    def downloaded(self, url, ok):
+        if ok:
+            self.job.update_cache([url])
+
+    def stop(self):
+        self.finished.set()
+        return None
+
+    def back_off(self):
+        self.interval = min(WATCH_MAX_INTERVAL, self.interval * 2)
+
+    def poll(self):
+        """Poll once and queue new media. Returns seconds until the next poll, or None when done."""
+        log = self.job.log_message.emit
+        if self.job.isInterruptionRequested():
+            return self.stop()
+        try:
+            status, data, self.last_modified = get_engine().fetch_json_if_modified(
+                self.api_url, self.last_modified, headers=HEADERS
+            )
+        except Exception as e:
+            log(f"⚠️ Poll failed ({e}), retrying in {self.interval}s")
+            self.back_off()
+            return self.interval
+
+        if status == 404:
+            log("🛑 Thread is gone (404), stopping watch.")
+            return self.stop()
+        elif status == 200:
+            posts = data.get("posts", [])
+            new_posts = [p for p in posts if p.get("no", 0) > self.last_no]
+            if new_posts:
+                self.last_no = max(p["no"] for p in new_posts)
+                downloads = self.job.collect_media(self.board, new_posts, self.folder)
+                if downloads:
+                    log(f"🆕 {len(new_posts)} new post(s), {len(downloads)} file(s). Downloading...")
+                    self.batch.add_many(downloads)
+                self.interval = WATCH_MIN_INTERVAL
+            else:
+                self.back_off()
+            op = posts[0] if posts else {}
+            if op.get("archived") or op.get("closed"):
+                log("🛑 Thread was archived or closed, stopping watch.")
+                return self.stop()
+        elif status == 304:
+            self.back_off()
+        else:
+            log(f"⚠️ Poll failed ({status}), retrying in {self.interval}s")
+            self.back_off()
+        return self.interval
+
+
+class ThreadWatcher:
+    """
+    Polls every watched thread from one background thread, each on its own
+    schedule. Requests still go through the a.4cdn.org rate limit, so
+    hundreds of watches cost one thread and about one API call per second.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, watch):
+        """Poll ``watch`` now and then again after each delay it returns, until it returns None."""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), watch))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="4chan-watcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, watch = heapq.heappop(self._heap)
+            try:
+                delay = watch.poll()
+            except Exception as e:
+                watch.job.fail(watch.api_url, e)
+                delay = watch.stop()
+            if delay is not None:
+                with self._cond:
+                    heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), watch))
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_thread_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = ThreadWatcher()
+        return _watcher
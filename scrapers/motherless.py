@@ -0,0 +1,192 @@
+import os, http_client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bs4 import BeautifulSoup
+from pathlib import Path
+from urllib.parse import urlparse, urlencode, parse_qsl, urlunparse
+from http_client import HEADERS
+from download_engine import get_engine
+from cache_store import get_store
+from scrapers.base import DownloadThread, pyqtSignal, job_progress, find_last_page, crawl_pages
+
+# Gallery items are resolved to file URLs (a HEAD probe for images, a page
+# fetch for videos) this many at a time over the shared pooled session.
+RESOLVE_WORKERS = 8
+CDN_IMAGES = "https://cdn5-images.motherlessmedia.com/images"
+# Further ?page=N gallery pages fetched at once, and downloads queued ahead
+# of the engine while pages are still being resolved.
+PAGE_WORKERS = 4
+MAX_PENDING = 128
+
+
+class DownloadMotherlessThread(DownloadThread):
+    base_folder = Path("ISdownloads/motherless")
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = "motherless"
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def sanitize_filename(self, url):
+        path = urlparse(url).path
+        return os.path.basename(path)
+
+    def filter_cached(self, urls):
+        return get_store().filter_new(self.cache_name, urls)
+
+    def update_cache(self, urls):
+        get_store().add_many(self.cache_name, urls)
+
+    def download_files(self, urls, folder):
+        return get_engine().download(
+            [(u, folder / self.sanitize_filename(u)) for u in urls],
+            headers=HEADERS,
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+        )
+
+    def resolve_codename(self, codename, mediatype):
+        """
+        Return ``(file_url, final)`` for one gallery item. ``final`` is False
+        when the answer came from a failed probe and shouldn't be remembered.
+        """
+        if mediatype == "video":
+            page = http_client.get(f"https://motherless.com/{codename}", headers=HEADERS)
+            if page.status_code != 200:
+                return None, False
+            source = BeautifulSoup(page.text, 'html.parser').select_one("video source")
+            src = source.get("src") if source else None
+            return src, bool(src)
+
+        status = http_client.head(f"{CDN_IMAGES}/{codename}.gif", headers=HEADERS).status_code
+        if status == 200:
+            return f"{CDN_IMAGES}/{codename}.gif", True
+        return f"{CDN_IMAGES}/{codename}.jpg", status in (403, 404)
+
+    def resolve_gallery(self, items):
+        # Resolved codenames are remembered in the state table, so scanning the
+        # same gallery again costs no probes at all. Only this page's
+        # codenames are looked up.
+        store = get_store()
+        namespace = f"{self.cache_name}:codenames"
+        known = store.get_state_many(namespace, [codename for codename, _ in items])
+        file_urls = [known[codename] for codename, _ in items if codename in known]
+        pending = [(codename, mediatype) for codename, mediatype in items if codename not in known]
+        if file_urls:
+            self.log_message.emit(f"♻️ {len(file_urls)} gallery items already resolved")
+
+        resolved = {}
+        with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as pool:
+            futures = {pool.submit(self.resolve_codename, codename, mediatype): codename
+                       for codename, mediatype in pending}
+            for future in as_completed(futures):
+                if self.isInterruptionRequested():
+                    for f in futures:
+                        f.cancel()
+                    break
+                codename = futures[future]
+                try:
+                    file_url, final = future.result()
+                except Exception as e:
+                    self.log_message.emit(f"⚠️ Could not resolve {codename}: {e}")
+                    continue
+                if file_url:
+                    file_urls.append(file_url)
+                if final:
+                    resolved[codename] = file_url
+
+        store.set_state_many(namespace, resolved)
+        return file_urls
+
+    def run(self):
+        try:
+            self.download_motherless(self.url)
+        except Exception as e:
+            self.fail(self.url, e)
+
+    def page_url(self, url, page):
+        parts = urlparse(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k != "page"]
+        query.append(("page", str(page)))
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def gallery_items(self, soup):
+        return list(dict.fromkeys(
+            (item.get("data-codename"), item.get("data-mediatype", "image"))
+            for item in soup.select('div[data-codename]') if item.get("data-codename")
+        ))
+
+    def download_gallery(self, url, soup, folder):
+        # Every ?page=N is fetched PAGE_WORKERS at a time; each page's items
+        # are resolved and go straight into one bounded download batch, so
+        # the first files download while later pages are still being read.
+        # Pages linked from later pages are crawled as they are found.
+        current_page = int(dict(parse_qsl(urlparse(url).query)).get("page", "1") or 1)
+        last_page = max(current_page, find_last_page(soup))
+        self.log_message.emit(f"📁 Gallery links {last_page} page(s)")
+
+        batch = get_engine().open_batch(
+            headers=HEADERS,
+            progress=job_progress(self),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+            max_pending=MAX_PENDING,
+        )
+
+        def process_page(page):
+            if self.isInterruptionRequested():
+                return 0, 0
+            if page == current_page:
+                page_soup = soup
+            else:
+                response = http_client.get(self.page_url(url, page), headers=HEADERS)
+                if response.status_code != 200:
+                    self.log_message.emit(f"⚠️ Page {page} failed ({response.status_code})")
+                    return 0, 0
+                page_soup = BeautifulSoup(response.text, 'html.parser')
+            items = self.gallery_items(page_soup)
+            new_urls = self.filter_cached(u for u in self.resolve_gallery(items) if u)
+            batch.add_many((u, folder / self.sanitize_filename(u)) for u in new_urls)
+            self.log_message.emit(f"📄 Page {page}: {len(items)} items, {len(new_urls)} new")
+            return len(items), find_last_page(page_soup)
+
+        total_items = 0
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+            for count in crawl_pages(pool, process_page, last_page, self.log_message.emit):
+                total_items += count
+
+        new_urls = batch.close()
+        self.update_cache(new_urls)
+        self.log_message.emit(f"📁 {total_items} gallery items, {len(new_urls)} new file(s) downloaded")
+
+    def download_motherless(self, url):
+        folder = self.base_folder / urlparse(url).path.split("/")[-1]
+        folder.mkdir(parents=True, exist_ok=True)
+        file_urls = []
+
+        soup = BeautifulSoup(http_client.get(url, headers=HEADERS).text, 'html.parser')
+
+        if soup.select_one('#motherless-media-image'):
+            src = soup.select_one('#motherless-media-image').get('src')
+            if src:
+                self.log_message.emit(f"🖼️ Downloading image: {src}")
+                file_urls.append(src)
+        elif soup.select_one('video source'):
+            src = soup.select_one('video source').get('src')
+            if src:
+                self.log_message.emit(f"🎞️ Downloading video: {src}")
+                file_urls.append(src)
+        elif soup.select('div[data-codename]'):
+            self.download_gallery(url, soup, folder)
+            self.log_message.emit("✅ Finished downloading Motherless content")
+            return
+        else:
+            self.log_message.emit("❌ Content type not recognized.")
+
+        file_urls = self.filter_cached(u for u in file_urls if u)
+        new_urls = self.download_files(file_urls, folder)
+        self.update_cache(new_urls)
+        self.log_message.emit("✅ Finished downloading Motherless content")
@@ -0,0 +1,437 @@
+import os, html, threading, time, praw
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from http_client import LimitedSession
+from download_engine import get_engine
+from cache_store import get_store
+from scrapers.base import DownloadThread, pyqtSignal, SUPPORTED_EXTS, job_progress
+
+# Reddit returns at most 100 posts per listing request.
+LISTING_PAGE = 100
+# Media found while paging through a listing goes straight to the download
+# engine; paging only blocks once this many files are queued or in flight.
+MAX_PENDING = 64
+
+CACHE_NAME = "reddit"
+BASE_FOLDER = Path("ISdownloads/reddit")
+
+# Reddit hosts .jpeg and .webp on top of what the other sites use.
+MEDIA_EXTS = tuple(SUPPORTED_EXTS) + ('.jpeg', '.webp', '.mp4')
+
+_reddit = None
+_reddit_lock = threading.Lock()
+
+
+def get_reddit():
+    # Built on first use rather than at import, so loading this module (or the
+    # GUI) doesn't need Reddit credentials or pay for PRAW's setup.
+    global _reddit
+    with _reddit_lock:
+        if _reddit is None:
+            load_dotenv()
+            _reddit = praw.Reddit(
+                client_id=os.getenv("REDDIT_CLIENT_ID"),
+                client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+                user_agent=os.getenv("REDDIT_USER_AGENT"),
+                username=os.getenv("REDDIT_USERNAME"),
+                password=os.getenv("REDDIT_PASSWORD"),
+                requestor_kwargs={"session": LimitedSession()},
+            )
+        return _reddit
+
+
+def _is_media_url(url):
+    return urlparse(url).path.lower().endswith(MEDIA_EXTS)
+
+
+def _gallery_urls(data):
+    metadata = data.get("media_metadata") or {}
+    order = [item["media_id"] for item in (data.get("gallery_data") or {}).get("items", [])]
+    urls = []
+    for media_id in order or list(metadata):
+        meta = metadata.get(media_id) or {}
+        if meta.get("status") != "valid":
+            continue
+        source = meta.get("s") or {}
+        if meta.get("e") == "Image" and meta.get("m", "").startswith("image/"):
+            ext = meta["m"].split("/", 1)[1].replace("jpeg", "jpg")
+            urls.append(f"https://i.redd.it/{media_id}.{ext}")
+        elif source.get("gif") or source.get("mp4") or source.get("u"):
+            urls.append(html.unescape(source.get("gif") or source.get("mp4") or source.get("u")))
+    return urls
+
+
+def extract_media_urls(post):
+    """
+    Every downloadable file of a listing submission: gallery items, the
+    crosspost parent's media, direct links, and otherwise the full-size
+    preview of image posts. Uses only data the listing already returned.
+    """
+    data = vars(post) if not isinstance(post, dict) else post
+    parents = data.get("crosspost_parent_list")
+    if parents:
+        data = parents[0]
+
+    if data.get("is_gallery") or data.get("media_metadata"):
+        urls = _gallery_urls(data)
+        if urls:
+            return urls
+
+    url = data.get("url_overridden_by_dest") or data.get("url") or ""
+    if _is_media_url(url):
+        return [url]
+
+    if data.get("post_hint") == "image":
+        images = (data.get("preview") or {}).get("images") or []
+        if images and images[0].get("source", {}).get("url"):
+            return [html.unescape(images[0]["source"]["url"])]
+    return []
+
+
+def sanitize_filename(url):
+    return os.path.basename(urlparse(url).path.split("?")[0])
+
+
+def _pages(items, size=LISTING_PAGE):
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def advance_cursors(cursors, walked):
+    """
+    Move each cursor along ``walked`` -- ``(fullname, keys, finished)`` in
+    listing order -- stopping at the first post of its walk that didn't
+    finish, so the next run starts from that post again.
+    """
+    stopped = set()
+    for fullname, keys, finished in walked:
+        for key in keys:
+            if key in stopped:
+                continue
+            if finished:
+                cursors[key] = fullname
+            else:
+                stopped.add(key)
+
+
+def load_cursors(subreddit_name):
+    store = get_store()
+    namespace = f"{CACHE_NAME}:{subreddit_name}"
+    # The old skip-scan position was a place in whichever listing the
+    # last run used (hot by default), so it can't seed a /new cursor.
+    # Files the old runs saved are still skipped through the URL cache.
+    after_file = Path(f"cache/{subreddit_name}_last.txt")
+    if after_file.exists():
+        after_file.replace(after_file.with_suffix(".txt.migrated"))
+    return store.get_state_map(namespace)
+
+
+def is_seen_post(namespace, post_id):
+    return get_store().get_state(namespace, post_id) is not None
+
+
+def mark_seen(posts, namespace):
+    """
+    Yield ``(post, keys, seen)`` for every ``(post, keys)`` in ``posts``.
+    The seen-post index is queried once per listing page, for that
+    page's ids only.
+    """
+    store = get_store()
+    for page in _pages(posts):
+        seen = store.get_state_many(namespace, [post.id for post, _ in page])
+        for post, keys in page:
+            yield post, keys, post.id in seen
+
+
+def iter_new(subreddit, cursors, namespace, log=print):
+    """
+    Yield ``(post, keys)`` from /new in sync order: first everything above
+    the "newest" cursor (oldest first, one ``before`` page at a time), then
+    older posts below the "oldest" cursor. ``keys`` names the cursors the
+    post may move; they are only moved once the run knows which posts
+    finished (see advance_cursors).
+    """
+    newest = cursors.get("newest")
+    if newest:
+        fetched = False
+        while True:
+            page = list(subreddit.new(limit=LISTING_PAGE, params={"before": newest}))
+            if not page:
+                break
+            fetched = True
+            for post in reversed(page):
+                newest = post.fullname
+                yield post, ("newest",)
+        if not fetched:
+            # An empty answer also happens when the cursor post was
+            # removed. Then walk down from the top until known posts and
+            # replay that stretch oldest first, from the known post on.
+            top = next(iter(subreddit.new(limit=1)), None)
+            if top is not None and top.fullname != newest and not is_seen_post(namespace, top.id):
+                log("⚠️ Sync cursor expired, scanning down to known posts")
+                missed = []
+                for post in subreddit.new(limit=None):
+                    if is_seen_post(namespace, post.id):
+                        cursors["newest"] = post.fullname
+                        break
+                    missed.append(post)
+                for post in reversed(missed):
+                    yield post, ("newest",)
+    else:
+        first = True
+        for post in subreddit.new(limit=None):
+            yield post, ("newest", "oldest") if first else ("oldest",)
+            first = False
+        return
+
+    if cursors.get("oldest"):
+        for post in subreddit.new(limit=None, params={"after": cursors["oldest"]}):
+            yield post, ("oldest",)
+
+
+def sync_subreddit(subreddit_name, limit, sort, should_stop, log, log_error, progress=None):
+    """
+    Download new media from one subreddit and move its sync state on.
+    ``should_stop`` is polled for cancellation, ``log`` gets progress lines
+    and ``log_error`` failures. Returns the number of files downloaded.
+    """
+    subreddit = get_reddit().subreddit(subreddit_name)
+    folder = BASE_FOLDER / subreddit_name
+    folder.mkdir(parents=True, exist_ok=True)
+    store = get_store()
+
+    seen_namespace = f"{CACHE_NAME}:{subreddit_name}:posts"
+    cursors = load_cursors(subreddit_name)
+    ranked = sort != "new"
+
+    if ranked:
+        # Hot and top have no stable order to put a cursor on. Known posts
+        # are skipped, and a full page of nothing but known posts ends the
+        # walk, so a run costs about one page per page of new content.
+        listing = {"hot": subreddit.hot, "top": subreddit.top}.get(sort, subreddit.hot)
+        posts = ((post, ()) for post in listing(limit=None))
+    else:
+        posts = iter_new(subreddit, cursors, seen_namespace, log)
+
+    def on_result(url, ok):
+        if ok:
+            log(f"🖼️ Downloaded: {sanitize_filename(url)}")
+        else:
+            log_error(f"❌ Failed to download {url}")
+
+    batch = get_engine().open_batch(
+        on_result=on_result,
+        progress=progress,
+        log=log,
+        should_stop=should_stop,
+        max_pending=MAX_PENDING,
+    )
+
+    walked = []     # (post id, fullname, cursor keys, seen before) in listing order
+    post_urls = {}  # post id -> (created_utc, media URLs queued for it)
+    known_in_a_row = 0
+    listed = mark_seen(posts, seen_namespace)
+    try:
+        for post, keys, seen in listed:
+            if should_stop():
+                break
+            if keys:
+                walked.append((post.id, post.fullname, keys, seen))
+            if seen or post.id in post_urls:
+                known_in_a_row += 1
+                if ranked and known_in_a_row >= LISTING_PAGE:
+                    break
+                continue
+            known_in_a_row = 0
+
+            urls = [url for url in extract_media_urls(post) if not store.contains(CACHE_NAME, url)]
+            post_urls[post.id] = (str(int(post.created_utc)), urls)
+            for url in urls:
+                batch.add(url, folder / sanitize_filename(url))
+            if batch.total >= limit:
+                break
+    finally:
+        listed.close()
+        posts.close()
+        new_urls = batch.close()
+    count = len(new_urls)
+
+    # Like 4chan board threads, a post only counts as synced once every
+    # file it queued arrived. Anything else stays out of the seen index
+    # and holds the cursors back, so the next run lists it again.
+    downloaded = set(new_urls)
+    finished = {post_id: created for post_id, (created, urls) in post_urls.items()
+                if all(url in downloaded for url in urls)}
+    store.add_many(CACHE_NAME, new_urls)
+    store.set_state_many(seen_namespace, finished)
+    advance_cursors(cursors, [(fullname, keys, seen or post_id in finished)
+                              for post_id, fullname, keys, seen in walked])
+    cursors["last_sync"] = str(int(time.time()))
+    cursors["last_count"] = str(count)
+    store.set_state_many(f"{CACHE_NAME}:{subreddit_name}", cursors)
+    log(f"✅ Downloaded {count} new image(s) from r/{subreddit_name} ({len(finished)} new posts)")
+    return count
+
+
+class DownloadRedditThread(DownloadThread):
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = CACHE_NAME
+
+    def __init__(self, subreddit, limit, sort="hot"):
+        super().__init__()
+        self.subreddit = subreddit
+        self.limit = limit
+        self.sort = sort
+
+    def run(self):
+        try:
+            sync_subreddit(self.subreddit, self.limit, self.sort, self.isInterruptionRequested,
+                           self.log_message.emit, self.log_to_file, job_progress(self, expected_files=self.limit))
+            self.progress_updated.emit(100)
+        except Exception as e:
+            self.fail(f"r/{self.subreddit}", e)
+
+
+class DownloadRedditSyncThread(DownloadThread):
+    """Incrementally sync a whole list of subreddits, ``max_in_flight`` at a time."""
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = CACHE_NAME
+
+    def __init__(self, subreddits, limit, sort="new", max_in_flight=4):
+        super().__init__()
+        self.subreddits = list(subreddits)
+        self.limit = limit
+        self.sort = sort
+        self.max_in_flight = max(1, max_in_flight)
+
+    def run(self):
+        try:
+            self.sync_all()
+        except Exception as e:
+            self.fail("subreddit sync", e)
+
+    def sync_one(self, subreddit_name):
+        if self.isInterruptionRequested():
+            return 0
+        return sync_subreddit(subreddit_name, self.limit, self.sort, self.isInterruptionRequested,
+                              lambda msg: self.log_message.emit(f"r/{subreddit_name}: {msg}"), self.log_to_file)
+
+    def sync_all(self):
+        # The subreddits synced longest ago go first, so a cancelled or
+        # time-boxed run is picked up fairly by the next one. All of them
+        # share one PRAW client and the process-wide reddit rate limit.
+        store = get_store()
+        last_sync = {
+            name: int(store.get_state(f"{self.cache_name}:{name}", "last_sync", 0))
+            for name in self.subreddits
+        }
+        order = sorted(self.subreddits, key=last_sync.get)
+        total = len(order)
+        self.log_message.emit(f"🔄 Syncing {total} subreddits, {self.max_in_flight} at a time")
+
+        done = 0
+        files = 0
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {pool.submit(self.sync_one, name): name for name in order}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    files += future.result()
+                except Exception as e:
+                    failed.append(name)
+                    self.log_message.emit(f"❌ r/{name}: {e}")
+                    self.log_to_file(f"❌ r/{name}: {e}")
+                done += 1
+                self.progress_updated.emit(int(done * 100 / total))
+
+        if failed:
+            self.error = f"{len(failed)} subreddit(s) failed"
+            self.log_message.emit(f"⚠️ {len(failed)} subreddit(s) failed: {', '.join(failed)}")
+        self.log_message.emit(f"✅ Sync finished: {files} new file(s) from {total - len(failed)} subreddits")
+
+
+class DownloadRedditUserThread(DownloadThread):
+    base_folder = Path("ISdownloads/reddit_users")
+    progress_updated = pyqtSignal(int)
+    progress_stats = pyqtSignal(dict)
+    log_message = pyqtSignal(str)
+    cache_name = "reddit_users"
+
+    def __init__(self, username, limit, sort="hot"):
+        super().__init__()
+        self.username = username
+        self.limit = limit
+        self.sort = sort
+
+    def sanitize_filename(self, url):
+        return os.path.basename(urlparse(url).path.split("?")[0])
+
+    def filter_cached(self, urls):
+        return get_store().filter_new(self.cache_name, urls)
+
+    def is_cached(self, url):
+        return get_store().contains(self.cache_name, url)
+
+    def update_cache(self, urls):
+        get_store().add_many(self.cache_name, urls)
+
+    def run(self):
+        try:
+            self.download_user_images(self.username, self.limit)
+        except Exception as e:
+            self.fail(f"u/{self.username}", e)
+
+    def download_user_images(self, username, limit):
+        user = get_reddit().redditor(username)
+        folder = self.base_folder / username
+        folder.mkdir(parents=True, exist_ok=True)
+
+        posts = {
+            "hot": user.submissions.hot,
+            "new": user.submissions.new,
+            "top": user.submissions.top
+        }.get(self.sort, user.submissions.hot)
+
+        def on_result(url, ok):
+            if ok:
+                self.log_message.emit(f"📥 {self.sanitize_filename(url)}")
+            else:
+                self.log_to_file(f"❌ Failed to download {url}")
+
+        batch = get_engine().open_batch(
+            on_result=on_result,
+            progress=job_progress(self, expected_files=limit or 0),
+            log=self.log_message.emit,
+            should_stop=self.isInterruptionRequested,
+            max_pending=MAX_PENDING,
+        )
+
+        try:
+            for post in posts(limit=None):
+                if self.isInterruptionRequested():
+                    break
+                for url in extract_media_urls(post):
+                    if not self.is_cached(url):
+                        batch.add(url, folder / self.sanitize_filename(url))
+                if limit and batch.total >= limit:
+                    break
+        finally:
+            new_urls = batch.close()
+        count = len(new_urls)
+
+        self.progress_updated.emit(100)
+        self.update_cache(new_urls)
+        self.log_message.emit(f"✅ Downloaded {count} image(s) from u/{username}")
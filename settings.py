@@ -0,0 +1,39 @@
+"""
+settings.json, read and written in one place.
+
+The GUI stores its choices here and the engine, rate limiter, browser pool
+and metrics read their tuning from it when they are first created.
+"""
+import json, os
+
+SETTINGS_FILE = "settings.json"
+
+
+def load_settings():
+    """All settings as a dict; empty if the file is missing or unreadable."""
+    try:
+        if os.path.exists(SETTINGS_FILE):
+            with open(SETTINGS_FILE, "r") as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Failed to load settings: {e}")
+    return {}
+
+
+def get_setting(settings, key, default, cast=None):
+    """``settings[key]`` passed through ``cast``; ``default`` if it is missing or invalid."""
+    value = settings.get(key, default)
+    if cast is None:
+        return value
+    try:
+        return cast(value)
+    except Exception as e:
+        print(f"Invalid setting {key}={value!r} ({e}), using {default!r}")
+        return default
+
+
+def save_setting(key, value):
+    settings = load_settings()
+    settings[key] = value
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f)
@@ -0,0 +1,5 @@
+import os, sys
+
+# The modules live at the repository root; scrapers run without Qt in tests.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IMAGESCRAPER_HEADLESS", "1")
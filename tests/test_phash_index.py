@@ -0,0 +1,69 @@
+import random
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import phash_index
+
+
+def brute_force_groups(entries, threshold):
+    paths = [p for p, _ in entries]
+    parent = list(range(len(entries)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i, (_, a) in enumerate(entries):
+        for j in range(i + 1, len(entries)):
+            if bin(a ^ entries[j][1]).count("1") <= threshold:
+                parent[find(i)] = find(j)
+    groups = {}
+    for i, path in enumerate(paths):
+        groups.setdefault(find(i), []).append(path)
+    return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=len, reverse=True)
+
+
+def near_copies(rng, base, count, max_flips):
+    copies = []
+    for _ in range(count):
+        value = base
+        for bit in rng.sample(range(64), rng.randint(1, max_flips)):
+            value ^= 1 << bit
+        copies.append(value)
+    return copies
+
+
+@pytest.mark.parametrize("threshold", [4, 8, 11, 13])
+def test_find_near_duplicates_matches_brute_force(tmp_path, threshold):
+    rng = random.Random(threshold)
+    hashes = []
+    # Pairs exactly ``threshold`` bits apart with the differing bits spread
+    # evenly over the hash: a split into fewer than threshold + 1 blocks puts
+    # a differing bit in every block and misses them.
+    spread = sum(1 << int((i + 0.5) * 64 / threshold) for i in range(threshold))
+    for _ in range(20):
+        base = rng.getrandbits(64)
+        hashes.extend((base, base ^ spread))
+    for _ in range(40):
+        base = rng.getrandbits(64)
+        hashes.append(base)
+        hashes.extend(near_copies(rng, base, 3, threshold + 2))
+    entries = [(f"img{i}.jpg", value) for i, value in enumerate(hashes)]
+
+    index = phash_index.PHashIndex(path=tmp_path / "phash.npz", workers=1)
+    for path, value in entries:
+        index.add(path, value, 0.0)
+
+    assert index.find_near_duplicates(threshold) == brute_force_groups(entries, threshold)
+
+
+def test_journaled_hashes_survive_reload(tmp_path):
+    index = phash_index.PHashIndex(path=tmp_path / "phash.npz", workers=1)
+    for i in range(phash_index.SAVE_EVERY):
+        index.add(f"img{i}.jpg", i, float(i))
+
+    assert not (tmp_path / "phash.npz").exists()
+    assert len(phash_index.PHashIndex(path=tmp_path / "phash.npz", workers=1)) == phash_index.SAVE_EVERY
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("praw")
+pytest.importorskip("dotenv")
+
+from scrapers.reddit import advance_cursors
+
+
+def test_first_run_moves_both_cursors_when_everything_finished():
+    cursors = {}
+    advance_cursors(cursors, [
+        ("t3_c", ("newest", "oldest"), True),
+        ("t3_b", ("oldest",), True),
+        ("t3_a", ("oldest",), True),
+    ])
+    assert cursors == {"newest": "t3_c", "oldest": "t3_a"}
+
+
+def test_oldest_cursor_stops_before_unfinished_post():
+    cursors = {}
+    advance_cursors(cursors, [
+        ("t3_c", ("newest", "oldest"), True),
+        ("t3_b", ("oldest",), False),
+        ("t3_a", ("oldest",), True),
+    ])
+    assert cursors == {"newest": "t3_c", "oldest": "t3_c"}
+
+
+def test_newest_cursor_stays_put_when_first_new_post_unfinished():
+    cursors = {"newest": "t3_a", "oldest": "t3_0"}
+    advance_cursors(cursors, [
+        ("t3_b", ("newest",), False),
+        ("t3_c", ("newest",), True),
+        ("t3_z", ("oldest",), True),
+    ])
+    assert cursors == {"newest": "t3_a", "oldest": "t3_z"}
+
+
+def test_unfinished_top_post_holds_back_both_cursors():
+    cursors = {}
+    advance_cursors(cursors, [
+        ("t3_c", ("newest", "oldest"), False),
+        ("t3_b", ("oldest",), True),
+    ])
+    assert cursors == {}